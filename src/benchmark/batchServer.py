@@ -0,0 +1,182 @@
+import argparse
+import itertools
+import json
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from connector.replay import Replay
+
+# Every retrieve moves a batch one state further, so the client goes through a few polls like against the real API.
+STATES = ["validating", "in_progress", "finalizing", "completed"]
+
+
+class BatchBackend:
+    def __init__(self, failEvery: int = 0, rateLimitEvery: int = 0, retryAfter: float = 1.0):
+        self.failEvery = failEvery
+        self.rateLimitEvery = rateLimitEvery
+        self.retryAfter = retryAfter
+        self.replay = Replay("replay")
+        self.files: dict[str, tuple[str, bytes]] = {}
+        self.batches: dict[str, dict] = {}
+        self.ids = itertools.count(1)
+        self.requests = itertools.count(1)
+        self.completions = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def new_id(self, prefix: str) -> str:
+        with self.lock:
+            return f"{prefix}-{next(self.ids)}"
+
+    def add_file(self, filename: str, purpose: str, content: bytes) -> dict:
+        file_id = self.new_id("file")
+        self.files[file_id] = (filename, content)
+        return {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+
+    def rate_limited(self) -> bool:
+        return bool(self.rateLimitEvery) and next(self.completions) % self.rateLimitEvery == 0
+
+    def completion(self, body: dict) -> dict:
+        numbered_logText = body["messages"][-1]["content"].partition("Log: ")[2]
+        results = [{"attackType": answer.attackType, "confidence": answer.confidence,
+                    "evidence": answer.evidence, "line_no": answer.line_no}
+                   for answer in self.replay.answers(numbered_logText, False)]
+        return {"id": self.new_id("chatcmpl"), "object": "chat.completion", "created": int(time.time()),
+                "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "tool_calls",
+                             "message": {"role": "assistant", "content": None,
+                                         "tool_calls": [{"id": self.new_id("call"), "type": "function",
+                                                         "function": {"name": "log_analyzer",
+                                                                      "arguments": json.dumps({"results": results})}}]}}]}
+
+    def create_batch(self, inputFileId: str, endpoint: str, completionWindow: str) -> dict:
+        output, errors = [], []
+        for line in self.files[inputFileId][1].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            if self.failEvery and next(self.requests) % self.failEvery == 0:
+                errors.append({"id": self.new_id("batch_req"), "custom_id": request["custom_id"],
+                               "response": {"status_code": 500, "body": {"error": {"message": "stand-in failure"}}},
+                               "error": None})
+                continue
+            output.append({"id": self.new_id("batch_req"), "custom_id": request["custom_id"],
+                           "response": {"status_code": 200, "body": self.completion(request["body"])},
+                           "error": None})
+
+        def to_file(entries: list[dict], name: str) -> str | None:
+            if not entries:
+                return None
+            content = "".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8")
+            return self.add_file(name, "batch_output", content)["id"]
+
+        batch_id = self.new_id("batch")
+        self.batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": endpoint, "input_file_id": inputFileId,
+            "completion_window": completionWindow, "created_at": int(time.time()), "status": STATES[0],
+            "output_file_id": None, "error_file_id": None,
+            "request_counts": {"total": len(output) + len(errors), "completed": len(output), "failed": len(errors)},
+            "_output": to_file(output, f"{batch_id}_output.jsonl"),
+            "_errors": to_file(errors, f"{batch_id}_errors.jsonl"),
+        }
+        return self.public(batch_id)
+
+    def retrieve_batch(self, batchId: str) -> dict:
+        batch = self.batches[batchId]
+        batch["status"] = STATES[min(STATES.index(batch["status"]) + 1, len(STATES) - 1)]
+        if batch["status"] == "completed":
+            batch["output_file_id"] = batch["_output"]
+            batch["error_file_id"] = batch["_errors"]
+        return self.public(batchId)
+
+    def public(self, batchId: str) -> dict:
+        return {k: v for k, v in self.batches[batchId].items() if not k.startswith("_")}
+
+
+def handler_for(backend: BatchBackend):
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, status: int, payload: dict, headers: dict[str, str] | None = None) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def read_body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length", "0")))
+
+        def do_POST(self) -> None:
+            path = self.path.split("?")[0].rstrip("/")
+            if path.endswith("/files"):
+                header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+                message = BytesParser(policy=HTTP).parsebytes(header + self.read_body())
+                fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+                upload = fields["file"]
+                self.send_json(200, backend.add_file(upload.get_filename() or "batch.jsonl",
+                                                     fields["purpose"].get_content().strip(),
+                                                     upload.get_payload(decode=True)))
+            elif path.endswith("/chat/completions"):
+                # Requests that failed in a batch are sent directly, the scheduled mode sends all requests here.
+                body = json.loads(self.read_body())
+                if backend.rate_limited():
+                    self.send_json(429, {"error": {"message": "stand-in rate limit", "type": "requests",
+                                                   "code": "rate_limit_exceeded"}},
+                                   {"Retry-After": f"{backend.retryAfter:g}"})
+                    return
+                self.send_json(200, backend.completion(body))
+            elif path.endswith("/batches"):
+                request = json.loads(self.read_body())
+                if request["input_file_id"] not in backend.files:
+                    self.send_json(404, {"error": {"message": f"Unknown file {request['input_file_id']}"}})
+                    return
+                self.send_json(200, backend.create_batch(request["input_file_id"], request["endpoint"],
+                                                         request["completion_window"]))
+            else:
+                self.send_json(404, {"error": {"message": f"Unknown endpoint {path}"}})
+
+        def do_GET(self) -> None:
+            parts = self.path.split("?")[0].rstrip("/").split("/")
+            if parts[-2] == "batches" and parts[-1] in backend.batches:
+                self.send_json(200, backend.retrieve_batch(parts[-1]))
+            elif parts[-1] == "content" and parts[-3] == "files" and parts[-2] in backend.files:
+                data = backend.files[parts[-2]][1]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            else:
+                self.send_json(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI files, batches and chat completions endpoints, "
+                                                 "answers with the Replay signatures. Point OPENAI_BASE_URL at "
+                                                 "http://<host>:<port>/v1 and run with LLM_BATCH=on.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--fail-every", type=int, default=0, help="Let every n-th request fail")
+    parser.add_argument("--rate-limit-every", type=int, default=0,
+                        help="Answer every n-th chat completion with 429 and a Retry-After header")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of the 429 answers in seconds")
+    args = parser.parse_args()
+
+    backend = BatchBackend(args.fail_every, args.rate_limit_every, args.retry_after)
+    server = ThreadingHTTPServer((args.host, args.port), handler_for(backend))
+    print(f"Batch stand-in listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import argparse
+import random
+import sys
+import time
+from array import array
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from functools import cache
+from itertools import accumulate, chain, repeat
+from pathlib import Path
+
+from src.utils.fileHelper import ensure_dir
+from src.utils.logRowHelper import dictionary, format_apache_time, parse_line, random_apache_time
+from src.utils.models import LogRow
+
+PATHS = ["/", "/index.html", "/products", "/products?id=42", "/cart", "/login", "/api/v1/items", "/static/app.js",
+         "/static/style.css", "/images/logo.png", "/search?q=shoes", "/account/orders"]
+
+# The line layout comes from LogRow itself, filled in with str.format instead of building a LogRow per line.
+# Split around the time into the client part and the request part (which ends the line).
+LINE_TEMPLATE = str(LogRow(None, "{0}", "{1}", "{2}", "{3}", "{4}", "{5}", "{6}", "{7}", "{8}"))
+LINE_HEAD, LINE_TAIL = LINE_TEMPLATE.split("{1}")
+LINE_TAIL += "\n"
+TAIL_POOL = 4096
+TABLE_SIZE = 1 << 16
+
+
+@dataclass(frozen=True)
+class CorpusSpec:
+    # Every mix maps a value to its weight. rate is the mean number of lines per second of log time.
+    seed: int
+    start: datetime
+    rate: float = 50.0
+    clients: int = 5000
+    methods: dict[str, float] = field(default_factory=lambda: {"GET": 80, "POST": 14, "PUT": 3, "DELETE": 2, "HEAD": 1})
+    statuses: dict[str, float] = field(default_factory=lambda: {"200": 80, "304": 8, "301": 3, "404": 6, "403": 1, "500": 2})
+    protocols: dict[str, float] = field(default_factory=lambda: {"HTTP/1.1": 90, "HTTP/2.0": 10})
+    paths: dict[str, float] = field(default_factory=lambda: {path: 1 for path in PATHS})
+    referrers: dict[str, float] = field(default_factory=lambda: {**{referrer: 70 for referrer in dictionary['referrer']},
+                                                                 "https://www.google.com/": 20,
+                                                                 "https://www.bing.com/": 5,
+                                                                 "https://shop.example.com/products": 5})
+    uas: dict[str, float] = field(default_factory=lambda: {ua: 1 for ua in dictionary['ua']})
+
+    def validate(self) -> None:
+        # Anything parse_line would read differently is rejected up front, the output has to round-trip.
+        for name, mix in (("method", self.methods), ("path", self.paths), ("protocol", self.protocols)):
+            for value in mix:
+                if not value or any(c.isspace() or c == '"' for c in value):
+                    raise ValueError(f"Invalid {name} {value!r}: no whitespace or quotes allowed")
+        for name, mix in (("referrer", self.referrers), ("user agent", self.uas)):
+            for value in mix:
+                if '"' in value or "\n" in value or value != value.strip():
+                    raise ValueError(f"Invalid {name} {value!r}: no quotes, line breaks or outer whitespace allowed")
+        for status in self.statuses:
+            if len(status) != 3 or not status.isdigit():
+                raise ValueError(f"Invalid status {status!r}")
+        if self.rate <= 0 or self.clients <= 0:
+            raise ValueError("rate and clients must be positive")
+        for name, mix in (("methods", self.methods), ("statuses", self.statuses), ("protocols", self.protocols),
+                          ("paths", self.paths), ("referrers", self.referrers), ("uas", self.uas)):
+            if not mix or sum(mix.values()) <= 0:
+                raise ValueError(f"Mix {name} needs at least one value with a positive weight")
+
+
+def default_spec(seed: int) -> CorpusSpec:
+    # The start is drawn from the seed with a fixed end, so the same seed always gives the same corpus.
+    rng = random.Random(seed)
+    return CorpusSpec(seed, random_apache_time(end=datetime(2025, 1, 1, tzinfo=timezone.utc), rng=rng))
+
+
+def pick(rng: random.Random, mix: dict[str, float], count: int) -> list[str]:
+    return rng.choices(list(mix), cum_weights=list(accumulate(mix.values())), k=count)
+
+
+@cache
+def client_heads(seed: int, clients: int) -> list[str]:
+    # A fixed set of clients per seed with a long tail, a few of them send most requests. The table holds
+    # every client as often as its weight says, so a uniform index into it is a weighted draw.
+    rng = random.Random(f"{seed}/clients")
+    heads = [LINE_HEAD.format(f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}")
+             for _ in range(clients)]
+    weights = list(accumulate(1 / (rank + 1) for rank in range(clients)))
+    return [heads[min(bisect_right(weights, (j + 0.5) * weights[-1] / TABLE_SIZE), clients - 1)] for j in range(TABLE_SIZE)]
+
+
+def random_indices(rng: random.Random, count: int) -> array:
+    # count uniform indices into a table of TABLE_SIZE entries from one getrandbits call, no Python loop per line.
+    indices = array("H")
+    indices.frombytes(rng.getrandbits(16 * count).to_bytes(2 * count, "little") if count else b"")
+    if sys.byteorder == "big":
+        indices.byteswap()
+    return indices
+
+
+def generate_chunk(spec: CorpusSpec, index: int, firstLine: int, count: int) -> str:
+    rng = random.Random(f"{spec.seed}/{index}")
+
+    # Chunk n covers its own slice of log time, its sorted times keep the timestamps monotonic across chunks
+    # no matter which process generated them. Neighbouring chunks may share their border second.
+    first_second = int(firstLine / spec.rate)
+    window = max(first_second, int((firstLine + count) / spec.rate)) - first_second + 1
+    seconds = [first_second + j * window // TABLE_SIZE for j in range(TABLE_SIZE)]
+    moments = {second: format_apache_time(spec.start + timedelta(seconds=second)) for second in set(seconds)}
+    times = list(map(moments.__getitem__, seconds))
+
+    # Request fields are drawn for a pool of line tails, every line then only picks a client, a time and a tail.
+    pool = min(TAIL_POOL, 1 << (max(count, 1).bit_length() - 1))
+    tails = list(map(LINE_TAIL.format,
+                     repeat("", pool),
+                     repeat("", pool),
+                     pick(rng, spec.methods, pool),
+                     pick(rng, spec.paths, pool),
+                     pick(rng, spec.protocols, pool),
+                     pick(rng, spec.statuses, pool),
+                     (str(max(0, int(rng.gauss(5000, 2000)))) for _ in range(pool)),
+                     pick(rng, spec.referrers, pool),
+                     pick(rng, spec.uas, pool)))
+    tails *= TABLE_SIZE // pool
+
+    heads = client_heads(spec.seed, spec.clients)
+    return "".join(chain.from_iterable(zip(map(heads.__getitem__, random_indices(rng, count)),
+                                           map(times.__getitem__, sorted(random_indices(rng, count))),
+                                           map(tails.__getitem__, random_indices(rng, count)))))
+
+
+def chunks(lines: int, chunkLines: int) -> list[tuple[int, int, int]]:
+    return [(index, first, min(chunkLines, lines - first)) for index, first in enumerate(range(0, lines, chunkLines))]
+
+
+def generate_lines(spec: CorpusSpec, lines: int, chunkLines: int = 100000) -> list[str]:
+    spec.validate()
+    output: list[str] = []
+    for index, first, count in chunks(lines, chunkLines):
+        output.extend(generate_chunk(spec, index, first, count).splitlines())
+    return output
+
+
+def write_corpus(path: Path, spec: CorpusSpec, lines: int, workers: int = 1, chunkLines: int = 100000,
+                 bufferBytes: int = 16 * 2 ** 20) -> None:
+    # Chunks are written in order, at most 2 x workers are generated ahead of the writer.
+    spec.validate()
+    ensure_dir(path.parent)
+    with path.open("w", encoding="utf-8", newline="\n", buffering=bufferBytes) as f:
+        if workers <= 1:
+            for index, first, count in chunks(lines, chunkLines):
+                f.write(generate_chunk(spec, index, first, count))
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending: deque[Future] = deque()
+            for index, first, count in chunks(lines, chunkLines):
+                pending.append(executor.submit(generate_chunk, spec, index, first, count))
+                if len(pending) >= workers * 2:
+                    f.write(pending.popleft().result())
+            while pending:
+                f.write(pending.popleft().result())
+
+
+def verify_corpus(path: Path) -> int:
+    # Every line has to parse back into the same line, and no timestamp may go back in time.
+    previous = None
+    count = 0
+    with path.open(encoding="utf-8") as f:
+        for count, line in enumerate(f, 1):
+            line = line.rstrip("\n")
+            row = parse_line(line)
+            if row is None or str(row) != line:
+                raise ValueError(f"Line {count} does not round-trip through parse_line: {line}")
+            moment = datetime.strptime(row.time, "%d/%b/%Y:%H:%M:%S %z")
+            if previous is not None and moment < previous:
+                raise ValueError(f"Line {count} goes back in time: {row.time}")
+            previous = moment
+    return count
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    # "GET=80,POST=15" or just "GET,POST" for equal weights.
+    mix: dict[str, float] = {}
+    for item in value.split(","):
+        name, _, weight = item.strip().partition("=")
+        if name:
+            mix[name] = float(weight) if weight else 1.0
+    return mix
+
+
+def read_mix(path: Path) -> dict[str, float]:
+    # One value per line, for values with commas like user agents. A trailing tab and weight is optional.
+    mix: dict[str, float] = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        name, _, weight = line.partition("\t")
+        if name.strip():
+            mix[name.strip()] = float(weight) if weight else 1.0
+    return mix
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Generates a seeded Apache combined log with monotonic timestamps.")
+    parser.add_argument("--lines", type=int, required=True)
+    parser.add_argument("--output", type=Path, required=True)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--chunk-lines", type=int, default=100000)
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None, help="ISO time with offset, drawn from the seed by default")
+    parser.add_argument("--rate", type=float, default=None, help="Mean lines per second of log time")
+    parser.add_argument("--clients", type=int, default=None)
+    parser.add_argument("--methods", type=parse_mix, default=None, help="e.g. GET=80,POST=15,PUT=5")
+    parser.add_argument("--statuses", type=parse_mix, default=None, help="e.g. 200=90,404=10")
+    parser.add_argument("--protocols", type=parse_mix, default=None)
+    parser.add_argument("--paths", type=parse_mix, default=None)
+    parser.add_argument("--paths-file", type=Path, default=None)
+    parser.add_argument("--referrers-file", type=Path, default=None)
+    parser.add_argument("--uas-file", type=Path, default=None)
+    parser.add_argument("--verify", action="store_true", help="Parse the written file back and check the timestamps")
+    args = parser.parse_args()
+
+    spec = default_spec(args.seed)
+    overrides = {
+        "start": args.start,
+        "rate": args.rate,
+        "clients": args.clients,
+        "methods": args.methods,
+        "statuses": args.statuses,
+        "protocols": args.protocols,
+        "paths": read_mix(args.paths_file) if args.paths_file else args.paths,
+        "referrers": read_mix(args.referrers_file) if args.referrers_file else None,
+        "uas": read_mix(args.uas_file) if args.uas_file else None,
+    }
+    spec = CorpusSpec(**{**spec.__dict__, **{k: v for k, v in overrides.items() if v is not None}})
+    if spec.start.tzinfo is None:
+        raise ValueError("--start needs a UTC offset, e.g. 2024-01-01T00:00:00+00:00")
+
+    t0 = time.perf_counter()
+    write_corpus(args.output, spec, args.lines, args.workers, args.chunk_lines)
+    seconds = time.perf_counter() - t0
+    print(f"Wrote {args.lines} lines to {args.output} in {seconds:.2f}s ({args.lines / seconds:.0f} lines/s)")
+
+    if args.verify:
+        print(f"Verified {verify_corpus(args.output)} lines")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
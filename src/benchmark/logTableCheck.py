@@ -0,0 +1,65 @@
+import argparse
+import sys
+
+from benchmark.pipeline import synthetic_lines
+from src.utils.logRowHelper import fast_parse_apache_time, parse_line
+from src.utils.logTable import LogTable
+
+
+def edge_lines(count: int) -> list[str]:
+    # Payloads with spaces put arbitrary words into the method and protocol slots, scanners send junk methods.
+    head = '10.0.0.1 - - [10/Oct/2000:13:55:36 -0700] "'
+    tail = '" 200 512 "-" "scanner"'
+    lines = [f"{head}GET /x?id=1 UNION{i} SELECT{tail}" for i in range(count)]
+    lines += [f"{head}M{i} /x HTTP/1.1{tail}" for i in range(count)]
+    lines += [
+        '::1 - - [10/Oct/2000:13:55:36 -0700] "GET /a HTTP/1.0" 200 2326 "-" "x"',
+        '010.0.0.1 - - [1/Oct/2000:13:55:36 -0700] "GET  /a  b  c" 007 0012 "r" "x" 55',
+        '1.2.3.4 a b [10/oct/2000:13:55:36 -0000] "" 404 - "" ""',
+        '1.2.3.4 a b [29/Feb/2001:13:55:36 +0530] "POST" 500 - "" ""  ',
+        '1.2.3.4 - - [10/Oct/2000:13:55:36 -0700] "GET /a HTTP/1.0" 200 99999999999999999999 "-" "x"',
+        '1.2.3.4 - - [10/Oct/2000:13:55:36 -0700] "GET /a HTTP/1.0" 200 ١٢ "-" "x"',
+        '1.2.3.4 - - [10/Oct/2000:13:55:36 -0700] "GET /a HTTP/1.0" ٢٠٠ 5 "-" "x"',
+        '255.255.255.255 - - [31/Dec/1969:23:59:59 +1400] "X /p%20q HTTP/2" 200 0 "-" "u"',
+        '1.2.3.4 - - [01/Jan/0000:00:00:00 +0000] "GET /a HTTP/1.0" 200 5 "-" "x"',
+        '1.2.3.4 - - [01/Jan/0001:00:00:00 +0000] "GET /a HTTP/1.0" 200 5 "-" "x"',
+        '1.2.3.4 - - [01/Jan/0001:00:30:00 +0100] "GET /a HTTP/1.0" 200 5 "-" "x"',
+        '1.2.3.4 - - [05/Mar/0999:10:00:00 -0130] "GET /a HTTP/1.0" 200 5 "-" "x"',
+        '1.2.3.4 - - [31/Dec/9999:23:59:59 +0000] "GET /a HTTP/1.0" 200 5 "-" "x"',
+        'garbage',
+    ]
+    return lines
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Checks that every LogTable row renders exactly like parse_line.")
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--distinct", type=int, default=300, help="Distinct methods and protocols in the edge lines")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    lines = synthetic_lines(args.lines, args.seed) + edge_lines(args.distinct)
+    table = LogTable.from_lines(lines)
+    expected = [row for row in map(parse_line, lines) if row is not None]
+
+    failures = 0
+    if len(table) != len(expected) or table.skipped != len(lines) - len(expected):
+        print(f"FAILED: {len(table)} rows and {table.skipped} skipped for {len(expected)} parsed lines")
+        failures += 1
+    for row, parsed in zip(table, expected):
+        if str(row) != str(parsed):
+            print(f"FAILED: line {row.line_no} renders as {row} instead of {parsed}")
+            failures += 1
+        moment = table.datetime(row.index)
+        if moment is not None and (moment != fast_parse_apache_time(row.time) or moment.utcoffset() != fast_parse_apache_time(row.time).utcoffset()):
+            print(f"FAILED: line {row.line_no} has datetime {moment} for {row.time}")
+            failures += 1
+
+    print(f"Rows: {len(table)}, Skipped: {table.skipped}, Raw fields: {len(table.raw)}, "
+          f"Methods: {len(table.method_pool)}, Protocols: {len(table.protocol_pool)}, "
+          f"Column bytes: {table.nbytes()}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+import argparse
+import gc
+import json
+import math
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import cache, cached_property
+from pathlib import Path
+from typing import Callable
+
+from benchmark.pipeline import PAYLOADS_DIR, synthetic_lines
+from injector import Injector
+from src.comparer import Comparer
+from src.sanitizer import Sanitizer
+from src.utils.logRowHelper import build_log_line_with_payload, build_log_lines_with_payloads, parse_line, TimestampIndex
+from src.utils.logTable import LogTable
+from src.utils.models import AttackPayloads, InjectionRecord, LLMAnswer
+from src.utils.splitter import Splitter
+
+SIZES = [1000, 100000, 1000000]
+CAMO_DIR = PAYLOADS_DIR.joinpath("camouflage")
+MODELS = ["model_a", "model_b"]
+
+
+@cache
+def injector() -> Injector:
+    return Injector(AttackPayloads(PAYLOADS_DIR.joinpath("attacks")))
+
+
+class Fixture:
+    def __init__(self, size: int, seed: int):
+        # Injections grow with the package (about 2% of the lines), so do_compare and the sanitizers, which scale
+        # with the injections, are measured per package line as well and code quadratic in them shows up.
+        self.size = size
+        self.seed = seed
+        self.per_attack = max(5, size // 200)
+        self.lines = synthetic_lines(size, seed)
+
+    @cached_property
+    def injected(self) -> tuple[list[InjectionRecord], list[str]]:
+        return injector().inject(self.lines, self.per_attack, seed=self.seed)
+
+    @cached_property
+    def payloads(self) -> list[str]:
+        rng = random.Random(self.seed)
+        return [rng.choice(payloads) for payloads in injector().attacks.payloads.values() for _ in range(self.size // 4 + 1)][:self.size]
+
+    @cached_property
+    def answers(self) -> dict[str, tuple[list[LLMAnswer], float]]:
+        # Every model finds most injections with the right type and adds a few false positives.
+        rng = random.Random(self.seed)
+        injections, injected_lines = self.injected
+        answers = {}
+        for model in MODELS:
+            found = [(record.line_no, record.attack_type) for record in injections if rng.random() < 0.8]
+            found += [(rng.randint(1, len(injected_lines)), rng.choice(["SQLi", "XSS", "CmdInject", "DoS/DDoS"]))
+                      for _ in range(self.size // 500)]
+            answers[model] = ([LLMAnswer(i, attack_type, 0.9, injected_lines[line_no - 1], line_no)
+                               for i, (line_no, attack_type) in enumerate(found)], 1.0)
+        return answers
+
+
+# A case prepares everything that is not measured and returns the call that is. Every repetition gets a fresh
+# call, so stateful objects (sanitizer rng, comparer aggregates) start from the same state each time.
+def case_split(fixture: Fixture) -> Callable[[], object]:
+    splitter = Splitter(-1, 1000)
+    return lambda: splitter.split(fixture.lines)
+
+
+def case_inject(fixture: Fixture) -> Callable[[], object]:
+    timestamps = TimestampIndex()
+    return lambda: injector().inject(fixture.lines, fixture.per_attack, seed=fixture.seed, timestamps=timestamps)
+
+
+def case_file_sanitize(fixture: Fixture) -> Callable[[], object]:
+    injections, injected_lines = fixture.injected
+    sanitizer = Sanitizer(seed=fixture.seed)
+    return lambda: sanitizer.file_sanitize(injected_lines, injections, CAMO_DIR.joinpath("camo_file.txt"), "start", 5, TimestampIndex())
+
+
+def case_multi_sanitize(before: bool) -> Callable[[Fixture], Callable[[], object]]:
+    def case(fixture: Fixture) -> Callable[[], object]:
+        injections, injected_lines = fixture.injected
+        sanitizer = Sanitizer(seed=fixture.seed)
+        camo_path = CAMO_DIR.joinpath("camo_part_before.txt" if before else "camo_part_after.txt")
+        return lambda: sanitizer.multi_sanitize(injected_lines, list(injections), camo_path, before, TimestampIndex())
+    return case
+
+
+def case_build_log_line(fixture: Fixture) -> Callable[[], object]:
+    def run() -> list[str]:
+        rng = random.Random(fixture.seed)
+        timestamps = TimestampIndex()
+        lines = fixture.lines
+        return [str(build_log_line_with_payload(payload,
+                                                seed=rng.randint(0, 1000000),
+                                                line_before=lines[i - 1] if i > 0 else None,
+                                                line_after=lines[i],
+                                                timestamps=timestamps))
+                for i, payload in enumerate(fixture.payloads)]
+    return run
+
+
+def case_build_log_lines(perLineSeeds: bool) -> Callable[[Fixture], Callable[[], object]]:
+    def case(fixture: Fixture) -> Callable[[], object]:
+        def run() -> list[str]:
+            rng = random.Random(fixture.seed)
+            timestamps = TimestampIndex()
+            lines = fixture.lines
+            neighbours = [(timestamps.time_of(lines[i - 1]) if i > 0 else None, timestamps.time_of(lines[i]))
+                          for i in range(len(fixture.payloads))]
+            seeds = [rng.randint(0, 1000000) for _ in fixture.payloads] if perLineSeeds else None
+            return build_log_lines_with_payloads(fixture.payloads, neighbours, seeds=seeds, rng=rng)
+        return run
+    return case
+
+
+def case_parse_line(fixture: Fixture) -> Callable[[], object]:
+    return lambda: [parse_line(line) for line in fixture.lines]
+
+
+def case_parse_table(fixture: Fixture) -> Callable[[], object]:
+    return lambda: LogTable.from_lines(fixture.lines)
+
+
+def case_do_compare(fixture: Fixture) -> Callable[[], object]:
+    injections, _ = fixture.injected
+    answers = fixture.answers
+    comparer = Comparer(textReports=False)
+    output_path = Path(tempfile.gettempdir())
+    return lambda: comparer.do_compare(output_path, "injected", injections, answers)
+
+
+CASES: dict[str, Callable[[Fixture], Callable[[], object]]] = {
+    "split": case_split,
+    "inject": case_inject,
+    "file_sanitize": case_file_sanitize,
+    "multi_sanitize_before": case_multi_sanitize(True),
+    "multi_sanitize_after": case_multi_sanitize(False),
+    "build_log_line_with_payload": case_build_log_line,
+    "build_log_lines_seeded": case_build_log_lines(True),
+    "build_log_lines_batch": case_build_log_lines(False),
+    "parse_line": case_parse_line,
+    "parse_table": case_parse_table,
+    "do_compare": case_do_compare,
+}
+
+
+def measure(case: Callable[[Fixture], Callable[[], object]],
+            fixture: Fixture,
+            repeat: int,
+            minTime: float,
+            memory: bool = True) -> dict:
+    # Best of the timed runs, then one extra run under tracemalloc, which would slow the timed ones down.
+    # Short calls are repeated until a run takes minTime, single microsecond calls are mostly timer noise.
+    # Like timeit the garbage collector is off while timing, a collection in one run is not the code's cost.
+    call = case(fixture)
+    t0 = time.perf_counter()
+    call()
+    number = max(1, math.ceil(minTime / max(time.perf_counter() - t0, 1e-9)))
+
+    seconds = math.inf
+    for _ in range(repeat):
+        call = case(fixture)
+        gc.collect()
+        gc.disable()
+        try:
+            t0 = time.perf_counter()
+            for _ in range(number):
+                call()
+            seconds = min(seconds, (time.perf_counter() - t0) / number)
+        finally:
+            gc.enable()
+
+    peak_bytes = 0
+    if memory:
+        call = case(fixture)
+        tracemalloc.start()
+        start_bytes = tracemalloc.get_traced_memory()[0]
+        call()
+        peak_bytes = tracemalloc.get_traced_memory()[1] - start_bytes
+        tracemalloc.stop()
+
+    return {"lines": fixture.size,
+            "seconds": seconds,
+            "ops_per_second": fixture.size / seconds if seconds else 0.0,
+            "peak_bytes": peak_bytes}
+
+
+def scaling(results: dict[str, dict]) -> dict[str, list[float]]:
+    # Exponent of the runtime between neighbouring sizes, ~1 is linear and ~2 quadratic.
+    exponents: dict[str, list[float]] = {}
+    for name in dict.fromkeys(key.split("/")[0] for key in results):
+        runs = sorted((r for key, r in results.items() if key.split("/")[0] == name), key=lambda r: r["lines"])
+        exponents[name] = [math.log(b["seconds"] / a["seconds"]) / math.log(b["lines"] / a["lines"])
+                           for a, b in zip(runs, runs[1:]) if a["seconds"] > 0 and b["lines"] > a["lines"]]
+    return exponents
+
+
+def compare_baseline(results: dict[str, dict],
+                     baseline: dict[str, dict],
+                     threshold: float,
+                     memoryThreshold: float,
+                     minCompareTime: float) -> list[str]:
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        base = baseline[key]
+        # Calls that only take a few microseconds move by more than the threshold between two runs of the same code.
+        if min(base["seconds"], result["seconds"]) < minCompareTime:
+            print(f"  {key:<40} skipped, below {minCompareTime}s per call")
+            continue
+        speed = result["ops_per_second"] / base["ops_per_second"] if base["ops_per_second"] else 1.0
+        memory = result["peak_bytes"] / base["peak_bytes"] if base["peak_bytes"] and result["peak_bytes"] else 1.0
+        status = "ok"
+        if speed < 1 - threshold:
+            status = "SLOWER"
+            regressions.append(f"{key}: {speed:.2f}x ops/s of the baseline")
+        if memory > 1 + memoryThreshold:
+            status = "MEMORY" if status == "ok" else f"{status}+MEMORY"
+            regressions.append(f"{key}: {memory:.2f}x peak memory of the baseline")
+        print(f"  {key:<40} {speed:>6.2f}x ops/s {memory:>6.2f}x memory  {status}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Micro benchmarks for the generation and scoring hot paths.")
+    parser.add_argument("--sizes", type=int, nargs="*", default=SIZES)
+    parser.add_argument("--cases", nargs="*", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds a timed run takes at least")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--memory", choices=["on", "off"], default="on", help="Peak memory run under tracemalloc, slow for 1M lines")
+    parser.add_argument("--baseline", type=Path, default=None, help="Compare against a saved baseline, exit 1 on regressions")
+    parser.add_argument("--save-baseline", type=Path, default=None)
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed ops/s drop against the baseline")
+    parser.add_argument("--memory-threshold", type=float, default=0.25, help="Allowed peak memory growth against the baseline")
+    parser.add_argument("--min-compare-time", type=float, default=0.001,
+                        help="Cases faster than this many seconds per call are not compared against the baseline")
+    parser.add_argument("--report", type=Path, default=None)
+    args = parser.parse_args()
+
+    results: dict[str, dict] = {}
+    print(f"{'case':<40} {'seconds':>10} {'ops/s':>14} {'peak MiB':>10}")
+    for size in args.sizes:
+        fixture = Fixture(size, args.seed)
+        for name in args.cases:
+            key = f"{name}/{size}"
+            results[key] = measure(CASES[name], fixture, args.repeat, args.min_time, args.memory == "on")
+            r = results[key]
+            print(f"{key:<40} {r['seconds']:>10.4f} {r['ops_per_second']:>14.1f} {r['peak_bytes'] / 2 ** 20:>10.2f}")
+
+    exponents = scaling(results)
+    if len(args.sizes) > 1:
+        print("Scaling exponents (1 = linear):")
+        for name, values in exponents.items():
+            print(f"  {name:<40} {' '.join(f'{v:.2f}' for v in values)}")
+
+    report = {"python": platform.python_version(),
+              "platform": platform.platform(),
+              "seed": args.seed,
+              "repeat": args.repeat,
+              "results": results,
+              "scaling": exponents}
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Saved baseline to {args.save_baseline}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if baseline.get("seed") != args.seed:
+            print(f"Baseline was recorded with seed {baseline.get('seed')}, not {args.seed}")
+        print(f"Against {args.baseline}:")
+        regressions = compare_baseline(results, baseline["results"], args.threshold, args.memory_threshold, args.min_compare_time)
+        if regressions:
+            print("Regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmark.corpus import default_spec, generate_lines, write_corpus
+from src.utils.fileHelper import ensure_dir
+
+PAYLOADS_DIR = Path(__file__).resolve().parents[1].joinpath("payloads")
+
+
+def synthetic_lines(count: int, seed: int) -> list[str]:
+    return generate_lines(default_spec(seed), count)
+
+
+def synthetic_log(path: Path, count: int, seed: int) -> None:
+    write_corpus(path, default_spec(seed), count)
+
+
+def configure_env(args: argparse.Namespace, workDir: Path) -> None:
+    os.environ.update({
+        "SEED": str(args.seed),
+        "MODEL_NAMES": ",".join(args.models),
+        "HARDENED_MODEL_NAMES": ",".join(args.hardened_models),
+        "REPLAY_LATENCY": args.latency,
+        "SPLITTER_PACKET_COUNT": str(args.packets),
+        "SPLITTER_PACKET_SIZE": str(args.packet_size),
+        "SPLITTER_TOKEN_BUDGET": str(args.token_budget),
+        "SPLITTER_TOKEN_RESERVE": str(args.token_reserve),
+        "PER_ATTACK": str(args.per_attack),
+        "MAXIMUM_FILE_SANITIZED": str(args.maximum_file_sanitized),
+        "ATTACKS_DIR": str(PAYLOADS_DIR.joinpath("attacks")),
+        "CAMO_DIR": str(PAYLOADS_DIR.joinpath("camouflage")),
+        "INPUT_DIR": str(workDir.joinpath("input")),
+        "INJECTED_DIR": str(workDir.joinpath("injected")),
+        "SANITIZED_DIR": str(workDir.joinpath("sanitized")),
+        "OUTPUT_DIR": str(workDir.joinpath("output")),
+        "RUN_MANIFEST": "fresh",
+        "TEXT_REPORTS": args.text_reports,
+    })
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Runs controller.main against the offline Replay connector.")
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--packets", type=int, default=-1)
+    parser.add_argument("--packet-size", type=int, default=1000)
+    parser.add_argument("--token-budget", type=int, default=-1)
+    parser.add_argument("--token-reserve", type=int, default=0)
+    parser.add_argument("--per-attack", type=int, default=5)
+    parser.add_argument("--maximum-file-sanitized", type=int, default=5)
+    parser.add_argument("--models", nargs="*", default=["replay"])
+    parser.add_argument("--hardened-models", nargs="*", default=["replay"])
+    parser.add_argument("--latency", default="fixed:0")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--text-reports", choices=["on", "off"], default="on")
+    parser.add_argument("--work-dir", type=Path, default=None)
+    parser.add_argument("--report", type=Path, default=None)
+    args = parser.parse_args()
+
+    workDir = args.work_dir or Path(tempfile.mkdtemp(prefix="pipeline_benchmark_"))
+    ensure_dir(workDir.joinpath("input"))
+    synthetic_log(workDir.joinpath("input", "synthetic.log"), args.lines, args.seed)
+    configure_env(args, workDir)
+
+    # The controller reads its configuration on import.
+    import controller
+
+    t0 = time.perf_counter()
+    timer = controller.main(args.seed)
+    wall = time.perf_counter() - t0
+
+    packages = timer.counts.get("inject", 0)
+    # Token packets differ in length, they never hold more than the generated lines though.
+    lines = min(packages * args.packet_size, args.lines)
+    report = {
+        "packages": packages,
+        "lines": lines,
+        "wall_seconds": wall,
+        "packages_per_second": packages / wall if wall else 0.0,
+        "lines_per_second": lines / wall if wall else 0.0,
+        "stages": {name: {"seconds": timer.totals[name], "count": timer.counts[name]} for name in timer.totals},
+    }
+
+    print("#" * 50)
+    print(f"Packages: {packages}, Lines: {lines}, Wall: {wall:.3f}s")
+    print(f"Packages/s: {report['packages_per_second']:.3f}, Lines/s: {report['lines_per_second']:.1f}")
+    for name, stage in report["stages"].items():
+        print(f"  {name}: {stage['seconds']:.4f}s ({stage['count']}x, {stage['seconds'] / wall * 100:.1f}%)")
+    print("#" * 50)
+
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    if args.work_dir is None:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
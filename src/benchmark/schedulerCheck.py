@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+from benchmark.batchServer import BatchBackend, handler_for
+from benchmark.pipeline import synthetic_lines
+from src.utils.fileHelper import write_lines
+
+MODEL = "gpt-4.1-mini"
+
+
+async def send(scheduler, connector, paths: list[Path], limits: list[float]) -> None:
+    state = scheduler.state(MODEL)
+
+    async def one(path: Path) -> None:
+        await scheduler.run(MODEL, connector, path, False)
+        limits.append(state.concurrency.limit)
+
+    await asyncio.gather(*[one(path) for path in paths])
+
+
+async def run_phases(scheduler, connector, backend: BatchBackend, paths: list[Path], rateLimitEvery: int) -> tuple[list[float], list[float]]:
+    # Both phases share one loop, the scheduler's conditions are bound to the loop they were first used in.
+    half = len(paths) // 2
+    limited: list[float] = []
+    recovered: list[float] = []
+    backend.rateLimitEvery = rateLimitEvery
+    await send(scheduler, connector, paths[:half], limited)
+    backend.rateLimitEvery = 0
+    await send(scheduler, connector, paths[half:], recovered)
+    return limited, recovered
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Sends ChatGPT requests through the RequestScheduler against the local "
+                                                 "stand-in, first with 429 answers, then without, and checks that the "
+                                                 "adaptive concurrency shrinks and recovers.")
+    parser.add_argument("--requests", type=int, default=80)
+    parser.add_argument("--lines", type=int, default=20)
+    parser.add_argument("--rate-limit-every", type=int, default=3)
+    parser.add_argument("--retry-after", type=float, default=2.0)
+    parser.add_argument("--initial-concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    backend = BatchBackend(retryAfter=args.retry_after)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler_for(backend))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # The OpenAI clients are created on first use and read these.
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "stand-in")
+    os.environ["LLM_MODE"] = "scheduled"
+    os.environ["LLM_STREAM"] = "off"
+    from connector import RequestScheduler, get_connector
+
+    workDir = Path(tempfile.mkdtemp(prefix="scheduler_check_"))
+    try:
+        paths = []
+        lines = synthetic_lines(args.requests * args.lines, args.seed)
+        for i in range(args.requests):
+            path = workDir.joinpath(f"packet{i}.log")
+            write_lines(path, lines[i * args.lines:(i + 1) * args.lines])
+            paths.append(path)
+
+        # The own back-off is kept tiny, a run only takes the Retry-After time if the header was used.
+        scheduler = RequestScheduler({}, initialConcurrency=args.initial_concurrency, maxRetries=-1, backoffSeconds=0.01)
+        t0 = time.perf_counter()
+        limited, recovered = asyncio.run(run_phases(scheduler, get_connector(MODEL), backend, paths, args.rate_limit_every))
+        wall = time.perf_counter() - t0
+    finally:
+        server.shutdown()
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    lowest = min(limited)
+    print(f"Scheduler: {scheduler}, Wall: {wall:.3f}s")
+    print(f"Concurrency: initial {args.initial_concurrency}, lowest {lowest:.2f} with 429s, "
+          f"{limited[-1]:.2f} -> {recovered[-1]:.2f} without")
+
+    failures = []
+    if scheduler.rate_limited == 0:
+        failures.append("no 429 reached the scheduler, the client retried them itself")
+    if lowest >= args.initial_concurrency:
+        failures.append("the concurrency limit never shrank")
+    if recovered[-1] <= limited[-1]:
+        failures.append("the concurrency limit did not recover")
+    if scheduler.rate_limited and wall < args.retry_after:
+        failures.append("Retry-After was not waited for")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,20 +2,122 @@ from pathlib import Path
 from typing import get_args
 
 from src.utils.fileHelper import write_lines, ensure_dir
-from src.utils.models import LLMAnswer, SanitizeRecord, InjectionRecord, ComparisonResult, AttackType
+from src.utils.models import LLMAnswer, SanitizeRecord, InjectionRecord, ComparisonResult, AttackType, GroupedAnswers
+from src.utils.resultStore import ResultBatch, ResultStore
+
+
+def group_injections(injections: list[InjectionRecord]) -> dict[str, dict[int, InjectionRecord]]:
+    groups: dict[str, dict[int, InjectionRecord]] = {}
+    for injection in injections:
+        groups.setdefault(injection.attack_type, {})[injection.line_no] = injection
+    return groups
+
+
+def group_answers(answers: list[LLMAnswer], time: float) -> GroupedAnswers:
+    by_type: dict[str, dict[int, LLMAnswer]] = {}
+    line_counts: dict[int | None, int] = {}
+    for answer in answers:
+        line_counts[answer.line_no] = line_counts.get(answer.line_no, 0) + 1
+        if answer.line_no is not None:
+            by_type.setdefault(answer.attackType, {})[answer.line_no] = answer
+    return GroupedAnswers(by_type, line_counts, len(answers), time)
+
+
+def without_lines(grouped: GroupedAnswers, lineNos: set[int]) -> GroupedAnswers:
+    by_type = {attackType: {line_no: answer for line_no, answer in answer_map.items() if line_no not in lineNos}
+               for attackType, answer_map in grouped.by_type.items()}
+    line_counts = {line_no: count for line_no, count in grouped.line_counts.items() if line_no not in lineNos}
+    return GroupedAnswers(by_type, line_counts, sum(line_counts.values()), grouped.time_needed)
+
+
+def report_lines(cr: ComparisonResult, details: list[tuple], answersTotal: int) -> list[str]:
+    sections: dict[str, list[str]] = {"TP": [], "FN": [], "FP": [], "ANSWER": []}
+    for kind, line_no, attack_type, text, confidence in details:
+        if kind == "FP":
+            sections[kind].append(f"  Line {line_no}: {text}")
+        elif kind == "ANSWER":
+            sections[kind].append(f"  Line {line_no}: {text} erkannt als {attack_type} mit der Sicherheit von {confidence}")
+        else:
+            sections[kind].append(f"  Line {line_no}: {attack_type} - {text}")
+
+    output_lines = [str(cr)]
+
+    if sections["TP"]:
+        output_lines.append("True Positives (korrekt erkannt):")
+        output_lines.extend(sections["TP"])
+        output_lines.append("")
+
+    if sections["FN"]:
+        output_lines.append("False Negatives (nicht erkannt):")
+        output_lines.extend(sections["FN"])
+        output_lines.append("")
+
+    if sections["FP"]:
+        output_lines.append("False Positives (fälschlicherweise erkannt):")
+        output_lines.extend(sections["FP"])
+
+    if answersTotal > 0:
+        output_lines.append("Alle Modell Antworten:")
+        output_lines.extend(sections["ANSWER"])
+        output_lines.append("")
+
+    return output_lines
+
+
+def package_report_lines(results: list[tuple[str, str, ComparisonResult]]) -> list[str]:
+    totals: dict[str, dict[str, ComparisonResult]] = {}
+    for model, attackType, cr in results:
+        total = totals.setdefault(model, {}).setdefault(attackType, ComparisonResult(0, 0, 0))
+        total.true_positives += cr.true_positives
+        total.false_negatives += cr.false_negatives
+        total.false_positives += cr.false_positives
+        total.time_needed += cr.time_needed
+    return [f"Model: {model}; AttackType: {attackType}; {str(totals[model][attackType])}"
+            for model in totals for attackType in totals[model]]
+
+
+def render_reports(store: ResultStore, outputPath: Path) -> None:
+    # Rebuilds the per comparison and per package .txt reports of a run that was stored with TEXT_REPORTS off.
+    details = store.details()
+    package_results: dict[tuple[str, str], list[tuple[str, str, ComparisonResult]]] = {}
+    for comparison_id, package_dir, package, variant, extra, attack_type, model, tp, fn, fp, time_needed, answers_total in store.comparisons():
+        cr = ComparisonResult(tp, fn, fp, time_needed)
+        report_dir = outputPath.joinpath(package_dir)
+        if variant != "injected":
+            report_dir = report_dir.joinpath(variant)
+        ensure_dir(report_dir)
+        write_lines(report_dir.joinpath(f"{attack_type.replace('/', '')}_{model}_{extra}.txt"),
+                    report_lines(cr, details.get(comparison_id, []), answers_total))
+        package_results.setdefault((package_dir, extra), []).append((model, attack_type, cr))
+
+    for package_dir, package in store.packages():
+        ensure_dir(outputPath.joinpath(package_dir))
+        for extra, name in (("injected", "injected"), ("normal", "sanitized"), ("filtered", "sanitized_filtered")):
+            write_lines(outputPath.joinpath(package_dir, f"package_{package}_{name}.txt"),
+                        package_report_lines(package_results.get((package_dir, extra), [])))
 
 
 class Comparer:
-    llm_results_global_injected: dict[str, dict[str, ComparisonResult]] = {}
-    llm_results_per_package_injected: dict[str, dict[str, ComparisonResult]]= {}
+    def __init__(self, textReports: bool = True, store: ResultStore | None = None, collect: bool = False):
+        # Without a store the rows are only collected, a worker process hands them back through merge.
+        self.textReports = textReports
+        self.store = store
+        self.collect = collect or store is not None
+        self.batch = ResultBatch()
+        self.package_dir = ""
+        self.package_index = 0
+
+        # Instance state, a worker process reuses its module and must not carry results between packages.
+        self.llm_results_global_injected: dict[str, dict[str, ComparisonResult]] = {}
+        self.llm_results_per_package_injected: dict[str, dict[str, ComparisonResult]]= {}
 
-    llm_results_global_sanitized: dict[str, dict[str, ComparisonResult]] = {}
-    llm_results_per_package_sanitized: dict[str, dict[str, ComparisonResult]] = {}
-    sanitized_number_of_entries: dict[str, dict[str, int]] = {}
+        self.llm_results_global_sanitized: dict[str, dict[str, ComparisonResult]] = {}
+        self.llm_results_per_package_sanitized: dict[str, dict[str, ComparisonResult]] = {}
+        self.sanitized_number_of_entries: dict[str, dict[str, int]] = {}
 
-    llm_results_global_sanitized_filtered: dict[str, dict[str, ComparisonResult]] = {}
-    llm_results_per_package_sanitized_filtered: dict[str, dict[str, ComparisonResult]] = {}
-    sanitized_filtered_number_of_entries: dict[str, dict[str, int]] = {}
+        self.llm_results_global_sanitized_filtered: dict[str, dict[str, ComparisonResult]] = {}
+        self.llm_results_per_package_sanitized_filtered: dict[str, dict[str, ComparisonResult]] = {}
+        self.sanitized_filtered_number_of_entries: dict[str, dict[str, int]] = {}
 
     def compare(self,
                 outputPath: Path,
@@ -24,6 +126,10 @@ class Comparer:
                 answersInjected: dict[str, tuple[list[LLMAnswer], float]],
                 sanatizeRecords: list[SanitizeRecord],
                 answersSanitized: list[dict[str, tuple[list[LLMAnswer], float]]]) -> None:
+        self.package_dir = outputPath.name
+        self.package_index = packageIndex
+        if self.collect:
+            self.batch.add_package(self.package_dir, packageIndex)
 
         cr_injected = self.do_compare(outputPath, "injected", injections, answersInjected)
         cr_sanatized, cr_list_filtered = self.compare_sanitized(outputPath, sanatizeRecords, answersSanitized)
@@ -41,6 +147,9 @@ class Comparer:
         self.complete_package_sanitized(outputPath.joinpath(f"package_{packageIndex}_sanitized.txt"))
         self.complete_package_sanitized_filtered(outputPath.joinpath(f"package_{packageIndex}_sanitized_filtered.txt"))
 
+        if self.store is not None:
+            self.store.write(self.batch)
+            self.batch = ResultBatch()
 
         return None
 
@@ -58,6 +167,7 @@ class Comparer:
                 result.true_positives += resultLocal.true_positives
                 result.false_negatives += resultLocal.false_negatives
                 result.false_positives += resultLocal.false_positives
+                # Every attack type carries the full request time of the model, so the last one already is the model total.
                 result.time_needed = resultLocal.time_needed
 
 
@@ -116,67 +226,58 @@ class Comparer:
                          answersInjected: dict[str, tuple[list[LLMAnswer], float]],
                          sanitize: bool = False,
                          filtered: bool = False) -> list[ComparisonResult]:
+        grouped_answers = {model: group_answers(answers, time) for model, (answers, time) in answersInjected.items()}
+        return self.score(outputPath, extra, group_injections(injections), grouped_answers, sanitize, filtered)
+
+    def score(self,
+              outputPath: Path,
+              extra: str,
+              injectionGroups: dict[str, dict[int, InjectionRecord]],
+              answerGroups: dict[str, GroupedAnswers],
+              sanitize: bool = False,
+              filtered: bool = False,
+              variant: str = "injected") -> list[ComparisonResult]:
+        # Injections and answers are grouped by attack type once, every (attack type, model) pair
+        # then only walks its own sorted line numbers instead of rescanning all injections and answers.
         cr_list = []
 
-
         for attackType in get_args(AttackType):
             if attackType == "UNKNOWN":
                 continue
 
+            injection_map = injectionGroups.get(attackType, {})
+            injection_line_nos = sorted(injection_map)
 
-            injection_map = {injection.line_no: injection for injection in injections if injection.attack_type == attackType}
-            injection_line_nos = set(injection_map.keys())
-
-            for model, answers_and_time in answersInjected.items():
-                answers, time = answers_and_time
-                answer_map = {answer.line_no: answer for answer in answers if answer.line_no is not None and answer.attackType == attackType}
-                answer_line_nos = set(answer_map.keys())
+            for model, grouped in answerGroups.items():
+                answer_map = grouped.by_type.get(attackType, {})
+                answer_line_nos = sorted(answer_map)
 
-                diff_FP = answer_line_nos.difference(injection_line_nos)
-                diff_FN = injection_line_nos.difference(answer_line_nos)
-                true_positives_lines = answer_line_nos.intersection(injection_line_nos)
+                true_positives_lines = [line_no for line_no in answer_line_nos if line_no in injection_map]
+                diff_FP = [line_no for line_no in answer_line_nos if line_no not in injection_map]
+                diff_FN = [line_no for line_no in injection_line_nos if line_no not in answer_map]
 
                 TP = len(true_positives_lines)
                 FN = len(diff_FN)
                 FP = len(diff_FP)
 
-                cr = ComparisonResult(TP, FN, FP, time)
+                cr = ComparisonResult(TP, FN, FP, grouped.time_needed)
                 cr_list.append(cr)
 
-                output_lines = [str(cr)]
-
-                if TP > 0:
-                    output_lines.append("True Positives (korrekt erkannt):")
-                    for line_no in sorted(true_positives_lines):
-                        payload = injection_map[line_no].payload
-                        attack_type = injection_map[line_no].attack_type
-                        output_lines.append(f"  Line {line_no}: {attack_type} - {payload}")
-                    output_lines.append("")
-
-                if FN > 0:
-                    output_lines.append("False Negatives (nicht erkannt):")
-                    for line_no in sorted(diff_FN):
-                        payload = injection_map[line_no].payload
-                        attack_type = injection_map[line_no].attack_type
-                        output_lines.append(f"  Line {line_no}: {attack_type} - {payload}")
-                    output_lines.append("")
-
-                if FP > 0:
-                    output_lines.append("False Positives (fälschlicherweise erkannt):")
-                    for line_no in sorted(diff_FP):
-                        payload = answer_map[line_no].evidence
-                        output_lines.append(f"  Line {line_no}: {payload}")
-
-                if len(answers) > 0:
-                    output_lines.append("Alle Modell Antworten:")
-                    for line_no in sorted(answer_map.keys()):
-                        answer = answer_map[line_no]
-                        output_lines.append(f"  Line {line_no}: {answer.evidence} erkannt als {answer.attackType} mit der Sicherheit von {answer.confidence}")
-                    output_lines.append("")
-
-
-                write_path = outputPath.joinpath(f"{attackType.replace("/", "")}_{model}_{extra}.txt")
-                write_lines(write_path, output_lines)
+                details = [("TP", line_no, injection_map[line_no].attack_type, injection_map[line_no].payload, None)
+                           for line_no in true_positives_lines]
+                details += [("FN", line_no, injection_map[line_no].attack_type, injection_map[line_no].payload, None)
+                            for line_no in diff_FN]
+                details += [("FP", line_no, None, answer_map[line_no].evidence, None) for line_no in diff_FP]
+                details += [("ANSWER", line_no, answer_map[line_no].attackType, answer_map[line_no].evidence, answer_map[line_no].confidence)
+                            for line_no in answer_line_nos]
+
+                if self.textReports:
+                    write_path = outputPath.joinpath(f"{attackType.replace("/", "")}_{model}_{extra}.txt")
+                    write_lines(write_path, report_lines(cr, details, grouped.total))
+
+                if self.collect:
+                    self.batch.add_comparison(self.package_dir, self.package_index, variant, extra, attackType, model,
+                                              TP, FN, FP, grouped.time_needed, grouped.total, details)
 
                 if sanitize:
                     if filtered:
@@ -197,38 +298,57 @@ class Comparer:
         cr_list_filtered = []
         for i, sanitizeRecord in enumerate(sanitizeRecords):
             camouflage_line_nos = {camouflage.line_no for camouflage in sanitizeRecord.camouflageRecords}
-            new_injections: list[InjectionRecord] = [
-                *sanitizeRecord.injectionRecords,
-                *[
-                    InjectionRecord(
-                        line_no=camouflage.line_no,
-                        attack_type="Sanitize",
-                        payload=camouflage.camouflage
-                    )
-                    for camouflage in sanitizeRecord.camouflageRecords
-                ]
-            ]
-
-            answer_dict = answersSanitized[i]
-            filtered_answers_dict: dict[str, tuple[list[LLMAnswer], float]] = {
-                model: (
-                    [answer for answer in answers if answer.line_no not in camouflage_line_nos],
-                    time
+
+            # The filtered run scores the plain injections, the normal run additionally expects the camouflage lines.
+            injection_groups_filtered = group_injections(sanitizeRecord.injectionRecords)
+            injection_groups = {attackType: dict(injection_map) for attackType, injection_map in injection_groups_filtered.items()}
+            sanitize_map = injection_groups.setdefault("Sanitize", {})
+            for camouflage in sanitizeRecord.camouflageRecords:
+                sanitize_map[camouflage.line_no] = InjectionRecord(
+                    line_no=camouflage.line_no,
+                    attack_type="Sanitize",
+                    payload=camouflage.camouflage
                 )
-                for model, (answers, time) in answer_dict.items()
-            }
+
+            answer_groups = {model: group_answers(answers, time) for model, (answers, time) in answersSanitized[i].items()}
+            answer_groups_filtered = {model: without_lines(grouped, camouflage_line_nos) for model, grouped in answer_groups.items()}
 
             new_outputPath = outputPath.joinpath(f"sanitized_{i}")
-            ensure_dir(new_outputPath)
+            if self.textReports:
+                ensure_dir(new_outputPath)
 
-            cr_list.append(self.do_compare(new_outputPath, f"normal", new_injections, answer_dict, True))
-            cr_list_filtered.append(self.do_compare(new_outputPath, f"filtered", sanitizeRecord.injectionRecords, filtered_answers_dict, True, True))
+            cr_list.append(self.score(new_outputPath, f"normal", injection_groups, answer_groups, True, variant=f"sanitized_{i}"))
+            cr_list_filtered.append(self.score(new_outputPath, f"filtered", injection_groups_filtered, answer_groups_filtered, True, True, f"sanitized_{i}"))
 
         return cr_list, cr_list_filtered
 
 
 
 
+    def merge(self, other: "Comparer") -> None:
+        self.merge_results(self.llm_results_global_injected, other.llm_results_global_injected)
+        self.merge_results(self.llm_results_global_sanitized, other.llm_results_global_sanitized)
+        self.merge_results(self.llm_results_global_sanitized_filtered, other.llm_results_global_sanitized_filtered)
+        if self.collect:
+            self.batch.extend(other.batch)
+            if self.store is not None:
+                self.store.write(self.batch)
+                self.batch = ResultBatch()
+
+    def merge_results(self,
+                      target: dict[str, dict[str, ComparisonResult]],
+                      source: dict[str, dict[str, ComparisonResult]]) -> None:
+        for model in source:
+            if model not in target:
+                target[model] = {}
+            for attackType in source[model]:
+                if attackType not in target[model]:
+                    target[model][attackType] = ComparisonResult(0, 0, 0)
+                target[model][attackType].true_positives += source[model][attackType].true_positives
+                target[model][attackType].false_negatives += source[model][attackType].false_negatives
+                target[model][attackType].false_positives += source[model][attackType].false_positives
+                target[model][attackType].time_needed += source[model][attackType].time_needed
+
     def update_model_injected(self, model: str, attackType: str, result: ComparisonResult) -> None:
         if model not in self.llm_results_per_package_injected:
             self.llm_results_per_package_injected[model] = {}
@@ -254,7 +374,8 @@ class Comparer:
 
                 outputLines.append(f"Model: {model}; AttackType: {attackType}; {str(self.llm_results_per_package_injected[model][attackType])}")
         self.llm_results_per_package_injected = {}
-        write_lines(outputPath, outputLines)
+        if self.textReports:
+            write_lines(outputPath, outputLines)
 
     def update_model_sanitized(self, model: str, attackType: str, result: ComparisonResult) -> None:
         if model not in self.llm_results_per_package_sanitized:
@@ -285,7 +406,8 @@ class Comparer:
                 outputLines.append(f"Model: {model}; AttackType: {attackType}; {str(self.llm_results_per_package_sanitized[model][attackType])}")
         self.llm_results_per_package_sanitized = {}
         self.sanitized_number_of_entries = {}
-        write_lines(outputPath, outputLines)
+        if self.textReports:
+            write_lines(outputPath, outputLines)
 
     def update_model_sanitized_filtered(self, model: str, attackType: str, result: ComparisonResult) -> None:
         if model not in self.llm_results_per_package_sanitized_filtered:
@@ -316,4 +438,5 @@ class Comparer:
                 outputLines.append(f"Model: {model}; AttackType: {attackType}; {str(self.llm_results_per_package_sanitized_filtered[model][attackType])}")
         self.llm_results_per_package_sanitized_filtered = {}
         self.sanitized_filtered_number_of_entries = {}
-        write_lines(outputPath, outputLines)
+        if self.textReports:
+            write_lines(outputPath, outputLines)
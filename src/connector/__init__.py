@@ -1,10 +1,36 @@
+import importlib
+import threading
 from typing import Dict
 
 from .baseConnector import Connector
-from .chatGPT import ChatGPT
-from .gemini import Gemini
 
 connector_registry: Dict[str, Connector] = {}
+registry_lock = threading.Lock()
+
+# Provider modules pull in their SDKs, they are only imported when one of their models is requested.
+# The helpers are resolved the same way, importing the package alone loads nothing but the base class.
+connector_modules = {
+    "ChatGPT": ".chatGPT",
+    "Gemini": ".gemini",
+    "Replay": ".replay",
+    "BatchJob": ".batch",
+    "ResponseCache": ".responseCache",
+    "CachedConnector": ".responseCache",
+    "RequestScheduler": ".scheduler",
+    "RateLimit": ".scheduler",
+}
+
+__all__ = ["Connector", "register_connector", "get_connector", *connector_modules]
+
+chatgpt_models = {"gpt-3.5-turbo", "gpt-3.5-turbo-16k", "gpt-4", "gpt-4.1-mini"}
+gemini_models = {"gemini-1.5-flash-latest", "gemini-2.5-flash-lite", "gemini-2.0-flash-lite-001"}
+
+
+def __getattr__(name: str):
+    # Keeps `from connector import ChatGPT` working without importing every provider up front.
+    if name in connector_modules:
+        return getattr(importlib.import_module(connector_modules[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def register_connector(name: str, connector: Connector) -> None:
@@ -15,22 +41,31 @@ def register_connector(name: str, connector: Connector) -> None:
 
 def get_connector(model_name: str) -> Connector:
     connector = connector_registry.get(model_name.lower())
+    if connector is not None:
+        return connector
+
+    with registry_lock:
+        connector = connector_registry.get(model_name.lower())
+        if connector is not None:
+            return connector
 
-    if connector is None:
         try:
             key = model_name.lower()
-            if key in {"gpt-3.5-turbo", "gpt-3.5-turbo-16k", "gpt-4", "gpt-4.1-mini"}:
+            if key in chatgpt_models:
                 try:
-                    connector = ChatGPT(key)
+                    connector = __getattr__("ChatGPT")(key)
                 except Exception as e:
                     raise ValueError(f"Failed to initialize ChatGPT connector {model_name}: {type(e).__name__}: {str(e)}")
                 register_connector(key, connector)
-            elif key in {"gemini-1.5-flash-latest", "gemini-2.5-flash-lite", "gemini-2.0-flash-lite-001"}:
+            elif key in gemini_models:
                 try:
-                    connector = Gemini(key)
+                    connector = __getattr__("Gemini")(key)
                 except Exception as e:
                     raise ValueError(f"Failed to initialize Gemini connector {model_name}: {type(e).__name__}: {str(e)}")
                 register_connector(key, connector)
+            elif key.startswith("replay"):
+                connector = __getattr__("Replay")(key)
+                register_connector(key, connector)
             else:
                 raise ValueError(f"Unknown connector: {model_name}")
         except Exception as e:
@@ -1,10 +1,51 @@
+import asyncio
+import contextlib
+import weakref
 from abc import ABC, abstractmethod
 from pathlib import Path
 
 from src.utils.models import LLMAnswer
 
 
+class RateLimitExceeded(Exception):
+    def __init__(self, message: str, retryAfter: float | None = None):
+        super().__init__(message)
+        self.retryAfter = retryAfter
+
+
 class Connector(ABC):
+    max_in_flight: int = -1
+
     @abstractmethod
     def connect(self, logPath: Path, hardened: bool) -> tuple[list[LLMAnswer], float]:
-        pass
\ No newline at end of file
+        pass
+
+    async def aconnect(self, logPath: Path, hardened: bool) -> tuple[list[LLMAnswer], float]:
+        async with self.in_flight_limit():
+            return await asyncio.to_thread(self.connect, logPath, hardened)
+
+    @abstractmethod
+    def prepare_log_with_line_numbers(self, logText: str) -> str:
+        pass
+
+    def prompt_overhead_tokens(self, hardened: bool) -> int:
+        # Estimated tokens of everything sent besides the numbered log lines.
+        return 0
+
+    def in_flight_limit(self) -> asyncio.Semaphore | contextlib.nullcontext:
+        if self.max_in_flight == -1:
+            return contextlib.nullcontext()
+
+        # One semaphore per provider class and event loop, asyncio primitives can't be shared between loops.
+        provider = type(self)
+        limits = provider.__dict__.get("in_flight_limits")
+        if limits is None:
+            limits = weakref.WeakKeyDictionary()
+            provider.in_flight_limits = limits
+
+        loop = asyncio.get_running_loop()
+        semaphore = limits.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_in_flight)
+            limits[loop] = semaphore
+        return semaphore
\ No newline at end of file
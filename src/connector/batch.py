@@ -0,0 +1,73 @@
+import json
+import time
+from pathlib import Path
+
+TERMINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchJob:
+    def __init__(self,
+                 client,
+                 workDir: Path,
+                 pollSeconds: float = 30.0,
+                 endpoint: str = "/v1/chat/completions",
+                 completionWindow: str = "24h"):
+        self.client = client
+        self.workDir = workDir
+        self.pollSeconds = pollSeconds
+        self.endpoint = endpoint
+        self.completionWindow = completionWindow
+        self.requests: list[dict] = []
+        self.seconds = 0.0
+
+    def __len__(self) -> int:
+        return len(self.requests)
+
+    def add(self, customId: str, body: dict) -> None:
+        self.requests.append({"custom_id": customId, "method": "POST", "url": self.endpoint, "body": body})
+
+    def run(self) -> tuple[dict[str, dict], dict[str, str]]:
+        # Returns the response bodies and the errors by custom_id, failed requests never hide the finished ones.
+        if not self.requests:
+            return {}, {}
+
+        t0 = time.perf_counter()
+        self.workDir.mkdir(parents=True, exist_ok=True)
+        input_path = self.workDir.joinpath(f"batch_{time.time_ns()}.jsonl")
+        with input_path.open("w", encoding="utf-8") as f:
+            for request in self.requests:
+                f.write(json.dumps(request) + "\n")
+
+        with input_path.open("rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(input_file_id=input_file.id,
+                                           endpoint=self.endpoint,
+                                           completion_window=self.completionWindow)
+        print(f"Submitted batch {batch.id} with {len(self.requests)} requests")
+
+        while batch.status not in TERMINAL_STATES:
+            time.sleep(self.pollSeconds)
+            batch = self.client.batches.retrieve(batch.id)
+            print(f"Batch {batch.id}: {batch.status}")
+
+        results: dict[str, dict] = {}
+        errors: dict[str, str] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response") or {}
+                if entry.get("error") or response.get("status_code") != 200:
+                    errors[entry["custom_id"]] = json.dumps(entry.get("error") or response.get("body"))
+                else:
+                    results[entry["custom_id"]] = response["body"]
+
+        for request in self.requests:
+            if request["custom_id"] not in results and request["custom_id"] not in errors:
+                errors[request["custom_id"]] = f"no result, batch {batch.id} ended with status {batch.status}"
+
+        self.seconds = time.perf_counter() - t0
+        return results, errors
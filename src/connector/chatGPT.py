@@ -1,43 +1,68 @@
 import json
 import os
 import time
+from functools import cache
 from pathlib import Path
 
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, RateLimitError
 
 from src.utils.models import LLMAnswer
-from .baseConnector import Connector
+from src.utils.promptEncoding import encode_numbered
+from src.utils.resultStream import ResultStream
+from src.utils.tokenEstimator import estimate_tokens
+from src.utils.timing import span
+from .baseConnector import Connector, RateLimitExceeded
+from .promptStructure import attack_types_summary, system_prompt
 
 
-class ChatGPT(Connector):
-    load_dotenv()
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+def client_options() -> dict:
+    # The scheduler backs off on 429s itself, SDK retries would hide them from its concurrency limit.
+    options = {"api_key": os.getenv("OPENAI_API_KEY")}
+    if os.getenv("LLM_MODE", "serial").strip().lower() == "scheduled":
+        options["max_retries"] = 0
+    return options
+
 
-    attack_types_path = Path("./connector/structure/attack_types.json")
-    attack_types = json.loads(attack_types_path.resolve().read_text(encoding="utf-8"))
-    attack_types_summary = "; ".join(f"{k}: {v['description']}" for k,v in attack_types["AttackTypes"].items())
+# Clients are shared by all ChatGPT models and only created once a request needs them.
+@cache
+def openai_client() -> OpenAI:
+    return OpenAI(**client_options())
 
-    system_prompts_path = Path("./connector/structure/system_prompts.json")
-    system_prompts = json.loads(system_prompts_path.resolve().read_text(encoding="utf-8"))
 
+@cache
+def async_openai_client() -> AsyncOpenAI:
+    return AsyncOpenAI(**client_options())
 
 
+class ChatGPT(Connector):
+    load_dotenv()
+    max_in_flight = int(os.getenv("OPENAI_MAX_IN_FLIGHT", "-1"))
+    streaming = os.getenv("LLM_STREAM", "off").strip().lower() in ("1", "true", "yes", "on")
+
     def __init__(self, model: str):
         self.model = model
 
+    @property
+    def client(self) -> OpenAI:
+        return openai_client()
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        return async_openai_client()
+
     def messages(self, logText: str, hardened: bool):
-        system_content = self.system_prompts["system_prompts"]["hardened" if hardened else "normal"]
+        system_content = system_prompt(hardened)
         return [
-            {"role": "system", "content": system_content + f"\n Use the AttackTypes summary below as DEFINITIONS ONLY. \n AttackTypes summary: {self.attack_types_summary}"},
+            {"role": "system", "content": system_content + f"\n Use the AttackTypes summary below as DEFINITIONS ONLY. \n AttackTypes summary: {attack_types_summary()}"},
             {"role": "system", "content": "Return JSON only, only using the fields defined by the log_analyzer function. I only need the response, no additional text. Don't generate a subject line. Instead of using placeholders, just leave out the placeholder brackets. You're allowed to use line breaks in your answer."},
             {"role": "system", "content": "IMPORTANT: Analyze EVERY line in the log file. Return ALL suspicious entries you find, not just a few examples."},
             {"role": "user", "content": "Analyse the following Log-Rows and give the results with the tool 'log_analyzer'."
                                         "Log: " + logText}
         ]
 
-    def create_and_send_request(self, logText: str, hardened: bool):
-        response = self.client.chat.completions.create(
+    def request_options(self, logText: str, hardened: bool) -> dict:
+        return dict(
             model=self.model,
             response_format={"type": "json_object"},
             messages=self.messages(logText, hardened),
@@ -83,33 +108,129 @@ class ChatGPT(Connector):
             tool_choice="required"
         )
 
+    def prompt_overhead_tokens(self, hardened: bool) -> int:
+        return estimate_tokens(json.dumps(self.request_options("", hardened)))
+
+    def create_and_send_request(self, logText: str, hardened: bool):
+        with span("prompt"):
+            options = self.request_options(logText, hardened)
+        try:
+            with span("request"):
+                response = self.client.chat.completions.create(**options)
+        except RateLimitError as e:
+            raise RateLimitExceeded(f"Rate limit for {self.model}: {e}", self.retry_after(e)) from e
+        return response.choices[0].message.tool_calls[0].function.arguments
+
+    async def acreate_and_send_request(self, logText: str, hardened: bool):
+        with span("prompt"):
+            options = self.request_options(logText, hardened)
+        try:
+            with span("request"):
+                response = await self.async_client.chat.completions.create(**options)
+        except RateLimitError as e:
+            raise RateLimitExceeded(f"Rate limit for {self.model}: {e}", self.retry_after(e)) from e
         return response.choices[0].message.tool_calls[0].function.arguments
 
+    def feed_chunk(self, stream: ResultStream, chunk) -> None:
+        # With include_usage the last chunk has no choices, only the token counts.
+        if chunk.usage is not None:
+            stream.output_tokens = chunk.usage.completion_tokens
+        if chunk.choices and chunk.choices[0].delta.tool_calls:
+            stream.feed(chunk.choices[0].delta.tool_calls[0].function.arguments)
+
+    def stream_request(self, logText: str, hardened: bool) -> list[LLMAnswer]:
+        with span("prompt"):
+            options = self.request_options(logText, hardened)
+        try:
+            with span("request"):
+                stream = ResultStream(self.model, self.parse_result)
+                for chunk in self.client.chat.completions.create(**options, stream=True, stream_options={"include_usage": True}):
+                    self.feed_chunk(stream, chunk)
+                return stream.finish()
+        except RateLimitError as e:
+            raise RateLimitExceeded(f"Rate limit for {self.model}: {e}", self.retry_after(e)) from e
+
+    async def astream_request(self, logText: str, hardened: bool) -> list[LLMAnswer]:
+        with span("prompt"):
+            options = self.request_options(logText, hardened)
+        try:
+            with span("request"):
+                stream = ResultStream(self.model, self.parse_result)
+                async for chunk in await self.async_client.chat.completions.create(**options, stream=True, stream_options={"include_usage": True}):
+                    self.feed_chunk(stream, chunk)
+                return stream.finish()
+        except RateLimitError as e:
+            raise RateLimitExceeded(f"Rate limit for {self.model}: {e}", self.retry_after(e)) from e
+
+    def retry_after(self, error: RateLimitError) -> float | None:
+        value = error.response.headers.get("retry-after")
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+
     def prepare_log_with_line_numbers(self, logText: str) -> str:
-        lines = logText.split('\n')
-        numbered_lines = [f"[LINE {i+1}] {line}" for i, line in enumerate(lines)]
-        return '\n'.join(numbered_lines)
+        return encode_numbered(logText.split('\n'))
 
 
     def connect(self, logPath: Path, hardened: bool) -> tuple[list[LLMAnswer], float]:
-        logText = logPath.read_text(encoding="utf-8")
-        numbered_logText = self.prepare_log_with_line_numbers(logText)
+        with span("read"):
+            logText = logPath.read_text(encoding="utf-8")
+        with span("prompt"):
+            numbered_logText = self.prepare_log_with_line_numbers(logText)
 
 
         t0 = time.perf_counter()
+        if self.streaming:
+            answers = self.stream_request(numbered_logText, hardened)
+            return answers, time.perf_counter() - t0
         detections = self.create_and_send_request(numbered_logText, hardened)
         time_needed = time.perf_counter() - t0
+
+        with span("decode"):
+            return self.parse_detections(detections), time_needed
+
+    async def aconnect(self, logPath: Path, hardened: bool) -> tuple[list[LLMAnswer], float]:
+        with span("read"):
+            logText = logPath.read_text(encoding="utf-8")
+        with span("prompt"):
+            numbered_logText = self.prepare_log_with_line_numbers(logText)
+
+        async with self.in_flight_limit():
+            t0 = time.perf_counter()
+            if self.streaming:
+                answers = await self.astream_request(numbered_logText, hardened)
+                return answers, time.perf_counter() - t0
+            detections = await self.acreate_and_send_request(numbered_logText, hardened)
+            time_needed = time.perf_counter() - t0
+
+        with span("decode"):
+            return self.parse_detections(detections), time_needed
+
+    def batch_body(self, logPath: Path, hardened: bool) -> dict:
+        with span("read"):
+            logText = logPath.read_text(encoding="utf-8")
+        with span("prompt"):
+            return self.request_options(self.prepare_log_with_line_numbers(logText), hardened)
+
+    def parse_batch_body(self, body: dict) -> list[LLMAnswer]:
+        return self.parse_detections(body["choices"][0]["message"]["tool_calls"][0]["function"]["arguments"])
+
+    def parse_detections(self, detections: str) -> list[LLMAnswer]:
         detections_json = json.loads(detections)
         results = detections_json.get("results", [])
 
         llm_answer: list[LLMAnswer] = []
         for i, det in enumerate(results):
-            llm_answer.append(LLMAnswer(
-                id=i,
-                attackType=det.get("attackType", "UNKNOWN"),
-                confidence=det.get("confidence", None),
-                evidence=det.get("evidence", ""),
-                line_no=det.get("line_no", None)
-            ))
-
-        return llm_answer, time_needed
+            llm_answer.append(self.parse_result(i, det))
+
+        return llm_answer
+
+    def parse_result(self, i: int, det: dict) -> LLMAnswer:
+        return LLMAnswer(
+            id=i,
+            attackType=det.get("attackType", "UNKNOWN"),
+            confidence=det.get("confidence", None),
+            evidence=det.get("evidence", ""),
+            line_no=det.get("line_no", None)
+        )
@@ -5,20 +5,21 @@ from pathlib import Path
 
 import google.generativeai as genai
 from dotenv import load_dotenv
+from google.api_core.exceptions import ResourceExhausted
 
 from src.utils.models import LLMAnswer
-from .baseConnector import Connector
+from src.utils.promptEncoding import encode_numbered
+from src.utils.resultStream import ResultStream
+from src.utils.tokenEstimator import estimate_tokens
+from src.utils.timing import span
+from .baseConnector import Connector, RateLimitExceeded
+from .promptStructure import attack_types_summary, system_prompt
 
 
 class Gemini(Connector):
     load_dotenv()
-
-    attack_types_path = Path("./connector/structure/attack_types.json")
-    attack_types = json.loads(attack_types_path.resolve().read_text(encoding="utf-8"))
-    attack_types_summary = "; ".join(f"{k}: {v['description']}" for k, v in attack_types["AttackTypes"].items())
-
-    system_prompts_path = Path("./connector/structure/system_prompts.json")
-    system_prompts = json.loads(system_prompts_path.resolve().read_text(encoding="utf-8"))
+    max_in_flight = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "-1"))
+    streaming = os.getenv("LLM_STREAM", "off").strip().lower() in ("1", "true", "yes", "on")
 
     def __init__(self, model: str):
         try:
@@ -54,7 +55,7 @@ class Gemini(Connector):
             }
         }
         system_instructions = (
-            f"Use the AttackTypes summary below as DEFINITIONS ONLY. \n AttackTypes summary: {self.attack_types_summary}"
+            f"Use the AttackTypes summary below as DEFINITIONS ONLY. \n AttackTypes summary: {attack_types_summary()}"
             "Return JSON only, only using the fields defined by the log_analyzer function. I only need the response, no additional text. Don't generate a subject line. Instead of using placeholders, just leave out the placeholder brackets. You're allowed to use line breaks in your answer."
             "IMPORTANT: Analyze EVERY line in the log file. Return ALL suspicious entries you find, not just a few examples."
         )
@@ -70,20 +71,91 @@ class Gemini(Connector):
             generation_config=generation_config,
             tools=[log_analyzer_tool]
         )
+        self.static_prompt = system_instructions + json.dumps(log_analyzer_tool)
 
-    def create_and_send_request(self, logText: str, hardened: bool) -> str:
-        system_content = self.system_prompts["system_prompts"]["hardened" if hardened else "normal"]
+    def user_prompt(self, logText: str, hardened: bool) -> str:
+        system_content = system_prompt(hardened)
 
-        user_prompt = (
+        return (
                 f"{system_content}\n "
                 "Analyse the following Log-Rows and give the results with the tool 'log_analyzer'.\n"
                 "Log:\n" + logText
         )
-        response = self.model.generate_content(
-            user_prompt,
-            tool_config={'function_calling_config': {'mode': 'ANY'}}
-        )
 
+    def prompt_overhead_tokens(self, hardened: bool) -> int:
+        return estimate_tokens(self.static_prompt + self.user_prompt("", hardened))
+
+    def create_and_send_request(self, logText: str, hardened: bool) -> str:
+        with span("prompt"):
+            prompt = self.user_prompt(logText, hardened)
+        try:
+            with span("request"):
+                response = self.model.generate_content(
+                    prompt,
+                    tool_config={'function_calling_config': {'mode': 'ANY'}}
+                )
+        except ResourceExhausted as e:
+            raise RateLimitExceeded(f"Rate limit for {self.model.model_name}: {e}") from e
+
+        return self.extract_detections(response)
+
+    async def acreate_and_send_request(self, logText: str, hardened: bool) -> str:
+        with span("prompt"):
+            prompt = self.user_prompt(logText, hardened)
+        try:
+            with span("request"):
+                response = await self.model.generate_content_async(
+                    prompt,
+                    tool_config={'function_calling_config': {'mode': 'ANY'}}
+                )
+        except ResourceExhausted as e:
+            raise RateLimitExceeded(f"Rate limit for {self.model.model_name}: {e}") from e
+
+        return self.extract_detections(response)
+
+    def feed_chunk(self, stream: ResultStream, chunk) -> None:
+        # Gemini streams whole function calls, a chunk carries complete results instead of argument pieces.
+        stream.mark_token()
+        if chunk.usage_metadata:
+            stream.output_tokens = chunk.usage_metadata.candidates_token_count
+        for part in chunk.candidates[0].content.parts:
+            if part.function_call and part.function_call.name == "log_analyzer":
+                args_dict = dict(part.function_call.args)
+                stream.feed(json.dumps({"results": [dict(item) for item in args_dict.get("results", [])]}))
+
+    def stream_request(self, logText: str, hardened: bool) -> list[LLMAnswer]:
+        with span("prompt"):
+            prompt = self.user_prompt(logText, hardened)
+        try:
+            with span("request"):
+                stream = ResultStream(self.model.model_name, self.parse_result)
+                for chunk in self.model.generate_content(prompt,
+                                                         tool_config={'function_calling_config': {'mode': 'ANY'}},
+                                                         stream=True):
+                    self.feed_chunk(stream, chunk)
+                if not stream.fragments:
+                    raise Exception("Kein 'log_analyzer'-Tool wurde verwendet.")
+                return stream.finish()
+        except ResourceExhausted as e:
+            raise RateLimitExceeded(f"Rate limit for {self.model.model_name}: {e}") from e
+
+    async def astream_request(self, logText: str, hardened: bool) -> list[LLMAnswer]:
+        with span("prompt"):
+            prompt = self.user_prompt(logText, hardened)
+        try:
+            with span("request"):
+                stream = ResultStream(self.model.model_name, self.parse_result)
+                async for chunk in await self.model.generate_content_async(prompt,
+                                                                           tool_config={'function_calling_config': {'mode': 'ANY'}},
+                                                                           stream=True):
+                    self.feed_chunk(stream, chunk)
+                if not stream.fragments:
+                    raise Exception("Kein 'log_analyzer'-Tool wurde verwendet.")
+                return stream.finish()
+        except ResourceExhausted as e:
+            raise RateLimitExceeded(f"Rate limit for {self.model.model_name}: {e}") from e
+
+    def extract_detections(self, response) -> str:
         function_call = response.candidates[0].content.parts[0].function_call
         if function_call.name == "log_analyzer":
             args_dict = dict(function_call.args)
@@ -96,29 +168,56 @@ class Gemini(Connector):
             raise Exception("Kein 'log_analyzer'-Tool wurde verwendet.")
 
     def prepare_log_with_line_numbers(self, logText: str) -> str:
-        lines = logText.strip().split('\n')
-        numbered_lines = [f"[LINE {i+1}] {line}" for i, line in enumerate(lines)]
-        return '\n'.join(numbered_lines)
+        return encode_numbered(logText.strip().split('\n'))
 
     def connect(self, logPath: Path, hardened: bool) -> tuple[list[LLMAnswer], float]:
-        logText = logPath.read_text(encoding="utf-8")
-        numbered_logText = self.prepare_log_with_line_numbers(logText)
+        with span("read"):
+            logText = logPath.read_text(encoding="utf-8")
+        with span("prompt"):
+            numbered_logText = self.prepare_log_with_line_numbers(logText)
 
         t0 = time.perf_counter()
+        if self.streaming:
+            answers = self.stream_request(numbered_logText, hardened)
+            return answers, time.perf_counter() - t0
         detections_str = self.create_and_send_request(numbered_logText, hardened)
         time_needed = time.perf_counter() - t0
 
+        with span("decode"):
+            return self.parse_detections(detections_str), time_needed
+
+    async def aconnect(self, logPath: Path, hardened: bool) -> tuple[list[LLMAnswer], float]:
+        with span("read"):
+            logText = logPath.read_text(encoding="utf-8")
+        with span("prompt"):
+            numbered_logText = self.prepare_log_with_line_numbers(logText)
+
+        async with self.in_flight_limit():
+            t0 = time.perf_counter()
+            if self.streaming:
+                answers = await self.astream_request(numbered_logText, hardened)
+                return answers, time.perf_counter() - t0
+            detections_str = await self.acreate_and_send_request(numbered_logText, hardened)
+            time_needed = time.perf_counter() - t0
+
+        with span("decode"):
+            return self.parse_detections(detections_str), time_needed
+
+    def parse_detections(self, detections_str: str) -> list[LLMAnswer]:
         detections_json = json.loads(detections_str)
         results = detections_json.get("results", [])
 
         llm_answer: list[LLMAnswer] = []
         for i, det in enumerate(results):
-            llm_answer.append(LLMAnswer(
-                id=i,
-                attackType=det.get("attackType", "UNKNOWN"),
-                confidence=det.get("confidence", 0.0),
-                evidence=det.get("evidence", ""),
-                line_no=det.get("line_no", 0)
-            ))
-
-        return llm_answer, time_needed
\ No newline at end of file
+            llm_answer.append(self.parse_result(i, det))
+
+        return llm_answer
+
+    def parse_result(self, i: int, det: dict) -> LLMAnswer:
+        return LLMAnswer(
+            id=i,
+            attackType=det.get("attackType", "UNKNOWN"),
+            confidence=det.get("confidence", 0.0),
+            evidence=det.get("evidence", ""),
+            line_no=det.get("line_no", 0)
+        )
\ No newline at end of file
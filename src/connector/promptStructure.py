@@ -0,0 +1,26 @@
+import json
+from functools import cache
+from pathlib import Path
+
+ATTACK_TYPES_PATH = Path("./connector/structure/attack_types.json")
+SYSTEM_PROMPTS_PATH = Path("./connector/structure/system_prompts.json")
+STRUCTURE_PATHS = [ATTACK_TYPES_PATH, SYSTEM_PROMPTS_PATH]
+
+
+# Read once on first use and shared by every connector, instead of in each class body at import time.
+@cache
+def load_structure(path: Path) -> dict:
+    return json.loads(path.resolve().read_text(encoding="utf-8"))
+
+
+def attack_types() -> dict:
+    return load_structure(ATTACK_TYPES_PATH)
+
+
+@cache
+def attack_types_summary() -> str:
+    return "; ".join(f"{k}: {v['description']}" for k, v in attack_types()["AttackTypes"].items())
+
+
+def system_prompt(hardened: bool) -> str:
+    return load_structure(SYSTEM_PROMPTS_PATH)["system_prompts"]["hardened" if hardened else "normal"]
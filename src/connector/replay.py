@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+import os
+import random
+import re
+import time
+from pathlib import Path
+
+from src.utils.models import LLMAnswer, AttackType
+from src.utils.promptEncoding import encode_numbered, decode_numbered
+from src.utils.timing import span
+from .baseConnector import Connector
+from .responseCache import ResponseCache
+
+# Matched against the lower-cased request, (?i) makes every alternation noticeably slower.
+SIGNATURES: dict[AttackType, re.Pattern] = {
+    "SQLi": re.compile(r"(union\s+select|'\s*or\s*'?1'?\s*=\s*'?1|;\s*drop\s+table|sleep\(\d+\)|--\s*$)"),
+    "XSS": re.compile(r"(<script|onerror\s*=|onload\s*=|javascript:|<svg|<iframe)"),
+    "CmdInject": re.compile(r"(;|\||`|\$\(|&&)\s*(ls|cat|whoami|id|rm|wget|curl|nc|uname|ping)\b"),
+    "DoS/DDoS": re.compile(r"(limit=\d{5}|size=\d{5}|\dgb|depth=\d{3}|1970-01-01)"),
+}
+
+
+class Replay(Connector):
+    def __init__(self, model: str):
+        self.model = model
+        self.latency = os.getenv("REPLAY_LATENCY", "fixed:0").split(":")
+        if self.latency[0] not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Invalid REPLAY_LATENCY: {':'.join(self.latency)}")
+
+        # Recordings are response cache entries of a real connector, e.g. REPLAY_SOURCE=ChatGPT:gpt-4.1-mini
+        recording_dir = os.getenv("REPLAY_RECORDING_DIR")
+        self.recordings = ResponseCache(Path(recording_dir).resolve()) if recording_dir else None
+        self.source_connector, _, self.source_model = os.getenv("REPLAY_SOURCE", "ChatGPT:gpt-4.1-mini").partition(":")
+
+    def prepare_log_with_line_numbers(self, logText: str) -> str:
+        return encode_numbered(logText.split('\n'))
+
+    def sample_latency(self, numbered_logText: str, hardened: bool) -> float:
+        digest = hashlib.sha256(f"{self.model}\n{hardened}\n{numbered_logText}".encode("utf-8")).digest()
+        rng = random.Random(int.from_bytes(digest[:8], "big"))
+
+        kind, *params = self.latency
+        values = [float(p) for p in params]
+        if kind == "fixed":
+            return values[0] if values else 0.0
+        if kind == "uniform":
+            return rng.uniform(values[0], values[1])
+        if kind == "normal":
+            return max(0.0, rng.gauss(values[0], values[1]))
+        return rng.lognormvariate(values[0], values[1])
+
+    def recorded(self, logText: str, hardened: bool) -> list[LLMAnswer] | None:
+        if self.recordings is None:
+            return None
+        key = self.recordings.log_key(self, self.source_connector, self.source_model, hardened, logText)
+        recorded = self.recordings.get(key)
+        return recorded[0] if recorded is not None else None
+
+    def answers(self, numbered_logText: str, hardened: bool) -> list[LLMAnswer]:
+        llm_answer: list[LLMAnswer] = []
+        for line_no, line in decode_numbered(numbered_logText):
+            # Referer and user agent are the last two quoted fields and never carry a payload.
+            request = line.rsplit(' "', 2)[0].lower()
+            for attackType, signature in SIGNATURES.items():
+                if signature.search(request):
+                    llm_answer.append(LLMAnswer(
+                        id=len(llm_answer),
+                        attackType=attackType,
+                        confidence=0.9,
+                        evidence=line,
+                        line_no=line_no
+                    ))
+                    break
+
+        return llm_answer
+
+    def connect(self, logPath: Path, hardened: bool) -> tuple[list[LLMAnswer], float]:
+        with span("read"):
+            logText = logPath.read_text(encoding="utf-8")
+        with span("prompt"):
+            numbered_logText = self.prepare_log_with_line_numbers(logText)
+
+        t0 = time.perf_counter()
+        with span("request"):
+            time.sleep(self.sample_latency(numbered_logText, hardened))
+        time_needed = time.perf_counter() - t0
+
+        with span("decode"):
+            answers = self.recorded(logText, hardened)
+            return answers if answers is not None else self.answers(numbered_logText, hardened), time_needed
+
+    async def aconnect(self, logPath: Path, hardened: bool) -> tuple[list[LLMAnswer], float]:
+        with span("read"):
+            logText = logPath.read_text(encoding="utf-8")
+        with span("prompt"):
+            numbered_logText = self.prepare_log_with_line_numbers(logText)
+
+        async with self.in_flight_limit():
+            t0 = time.perf_counter()
+            with span("request"):
+                await asyncio.sleep(self.sample_latency(numbered_logText, hardened))
+            time_needed = time.perf_counter() - t0
+
+        with span("decode"):
+            answers = self.recorded(logText, hardened)
+            return answers if answers is not None else self.answers(numbered_logText, hardened), time_needed
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Literal
+
+from src.utils.models import LLMAnswer
+from .baseConnector import Connector
+from .promptStructure import STRUCTURE_PATHS
+
+CacheMode = Literal["use", "refresh"]
+
+
+class ResponseCache:
+    structure_paths = STRUCTURE_PATHS
+
+    def __init__(self,
+                 cacheDir: Path,
+                 mode: CacheMode = "use",
+                 maxBytes: int = -1,
+                 maxAgeSeconds: float = -1):
+        if mode not in ("use", "refresh"):
+            raise ValueError(f"Invalid cache mode: {mode}")
+        self.cacheDir = cacheDir
+        self.mode = mode
+        self.maxBytes = maxBytes
+        self.maxAgeSeconds = maxAgeSeconds
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        self.lock = threading.Lock()
+        self.cacheDir.mkdir(parents=True, exist_ok=True)
+        self.structure_hash = self.hash_structure()
+        self.total_bytes = sum(entry.stat().st_size for entry in self.entries())
+        self.evict()
+
+    def hash_structure(self) -> str:
+        digest = hashlib.sha256()
+        for path in self.structure_paths:
+            digest.update(path.resolve().read_bytes())
+        return digest.hexdigest()
+
+    def key(self, connectorName: str, modelName: str, hardened: bool, numberedLogText: str) -> str:
+        log_hash = hashlib.sha256(numberedLogText.encode("utf-8")).hexdigest()
+        raw = f"{connectorName}\n{modelName.lower()}\n{hardened}\n{self.structure_hash}\n{log_hash}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def log_key(self, connector: Connector, connectorName: str, modelName: str, hardened: bool, logText: str) -> str:
+        # Numbered from the stripped log. Gemini strips before numbering and ChatGPT doesn't, so a recording of
+        # either has to look the same to Replay.
+        return self.key(connectorName, modelName, hardened, connector.prepare_log_with_line_numbers(logText.strip()))
+
+    def entry_path(self, key: str) -> Path:
+        return self.cacheDir.joinpath(key[:2], f"{key}.json")
+
+    def entries(self) -> list[Path]:
+        return list(self.cacheDir.glob("*/*.json"))
+
+    def get(self, key: str) -> tuple[list[LLMAnswer], float] | None:
+        if self.mode == "refresh":
+            with self.lock:
+                self.misses += 1
+            return None
+
+        path = self.entry_path(key)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        if self.expired(data["created"]):
+            self.remove(path)
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return [LLMAnswer(**answer) for answer in data["answers"]], data["time_needed"]
+
+    def put(self, key: str, modelName: str, hardened: bool, result: tuple[list[LLMAnswer], float]) -> None:
+        answers, time_needed = result
+        data = {
+            "model": modelName,
+            "hardened": hardened,
+            "created": time.time(),
+            "time_needed": time_needed,
+            "answers": [asdict(answer) for answer in answers],
+        }
+
+        path = self.entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        old_size = path.stat().st_size if path.exists() else 0
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.writes += 1
+            self.total_bytes += path.stat().st_size - old_size
+            over_limit = self.maxBytes != -1 and self.total_bytes > self.maxBytes
+        if over_limit:
+            self.evict()
+
+    def expired(self, created: float) -> bool:
+        return self.maxAgeSeconds != -1 and time.time() - created > self.maxAgeSeconds
+
+    def remove(self, path: Path) -> None:
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            return
+        with self.lock:
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def evict(self) -> None:
+        if self.maxBytes == -1 and self.maxAgeSeconds == -1:
+            return
+
+        remaining: list[tuple[float, Path]] = []
+        for path in self.entries():
+            try:
+                mtime = path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if self.maxAgeSeconds != -1 and time.time() - mtime > self.maxAgeSeconds:
+                self.remove(path)
+            else:
+                remaining.append((mtime, path))
+
+        if self.maxBytes == -1:
+            return
+
+        remaining.sort(key=lambda x: x[0])
+        for _, path in remaining:
+            if self.total_bytes <= self.maxBytes:
+                break
+            self.remove(path)
+
+    def __str__(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return f"Hits: {self.hits}, Misses: {self.misses}, Hit-Rate: {hit_rate}, Writes: {self.writes}, Evictions: {self.evictions}, Size: {self.total_bytes} Bytes"
+
+
+class CachedConnector(Connector):
+    def __init__(self, connector: Connector, modelName: str, cache: ResponseCache):
+        self.connector = connector
+        self.modelName = modelName
+        self.cache = cache
+
+    def prepare_log_with_line_numbers(self, logText: str) -> str:
+        return self.connector.prepare_log_with_line_numbers(logText)
+
+    def prompt_overhead_tokens(self, hardened: bool) -> int:
+        return self.connector.prompt_overhead_tokens(hardened)
+
+    def lookup(self, logPath: Path, hardened: bool) -> tuple[str, tuple[list[LLMAnswer], float] | None]:
+        key = self.cache.log_key(self.connector, type(self.connector).__name__, self.modelName, hardened,
+                                 logPath.read_text(encoding="utf-8"))
+        return key, self.cache.get(key)
+
+    def connect(self, logPath: Path, hardened: bool) -> tuple[list[LLMAnswer], float]:
+        key, cached = self.lookup(logPath, hardened)
+        if cached is not None:
+            return cached
+
+        result = self.connector.connect(logPath, hardened)
+        self.cache.put(key, self.modelName, hardened, result)
+        return result
+
+    async def aconnect(self, logPath: Path, hardened: bool) -> tuple[list[LLMAnswer], float]:
+        key, cached = self.lookup(logPath, hardened)
+        if cached is not None:
+            return cached
+
+        result = await self.connector.aconnect(logPath, hardened)
+        self.cache.put(key, self.modelName, hardened, result)
+        return result
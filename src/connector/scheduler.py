@@ -0,0 +1,179 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from src.utils.models import LLMAnswer
+from src.utils.tokenEstimator import estimate_tokens
+from .baseConnector import Connector, RateLimitExceeded
+from .responseCache import CachedConnector
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    requestsPerMinute: float = -1
+    tokensPerMinute: float = -1
+
+
+class TokenBucket:
+    def __init__(self, perMinute: float):
+        self.capacity = perMinute
+        self.rate = perMinute / 60.0
+        self.tokens = perMinute
+        self.last = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def wait_time(self, amount: float) -> float:
+        self.refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class AdaptiveLimit:
+    def __init__(self, initial: int, maximum: int, minimum: int = 1):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self) -> float:
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return time.monotonic()
+
+    async def release(self) -> None:
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self) -> None:
+        # Additive increase: roughly one extra slot per fully used window.
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_rate_limited(self, started: float) -> None:
+        # Requests that were already in flight during the last decrease belong to the same congestion event.
+        if started < self.last_decrease:
+            return
+        self.limit = max(self.minimum, self.limit / 2)
+        self.last_decrease = time.monotonic()
+
+
+class ModelState:
+    def __init__(self, rateLimit: RateLimit, initialConcurrency: int, maxConcurrency: int):
+        self.requests = TokenBucket(rateLimit.requestsPerMinute) if rateLimit.requestsPerMinute != -1 else None
+        self.tokens = TokenBucket(rateLimit.tokensPerMinute) if rateLimit.tokensPerMinute != -1 else None
+        self.concurrency = AdaptiveLimit(initialConcurrency, maxConcurrency)
+        self.bucket_lock = asyncio.Lock()
+
+    async def acquire_budget(self, tokens: int) -> None:
+        # The lock keeps queued requests in FIFO order while they wait for their budget.
+        async with self.bucket_lock:
+            while True:
+                wait = 0.0
+                if self.requests is not None:
+                    wait = max(wait, self.requests.wait_time(1))
+                if self.tokens is not None:
+                    wait = max(wait, self.tokens.wait_time(tokens))
+                if wait == 0.0:
+                    break
+                await asyncio.sleep(wait)
+
+            if self.requests is not None:
+                self.requests.consume(1)
+            if self.tokens is not None:
+                self.tokens.consume(tokens)
+
+
+class RequestScheduler:
+    def __init__(self,
+                 rateLimits: dict[str, RateLimit],
+                 initialConcurrency: int = 4,
+                 maxConcurrency: int = 64,
+                 maxRetries: int = 10,
+                 backoffSeconds: float = 1.0):
+        self.rateLimits = {name.lower(): limit for name, limit in rateLimits.items()}
+        self.initialConcurrency = initialConcurrency
+        self.maxConcurrency = maxConcurrency
+        self.maxRetries = maxRetries
+        self.backoffSeconds = backoffSeconds
+        self.states: dict[str, ModelState] = {}
+
+        self.requests = 0
+        self.rate_limited = 0
+        self.cached = 0
+
+    def share(self, parts: int) -> "RequestScheduler":
+        # One of `parts` schedulers that run side by side, e.g. one per worker process, and together stay within
+        # the configured budgets and concurrency.
+        def split(value: float) -> float:
+            return value / parts if value != -1 else -1
+
+        return RequestScheduler({name: RateLimit(split(limit.requestsPerMinute), split(limit.tokensPerMinute))
+                                 for name, limit in self.rateLimits.items()},
+                                initialConcurrency=max(1, self.initialConcurrency // parts),
+                                maxConcurrency=max(1, self.maxConcurrency // parts),
+                                maxRetries=self.maxRetries,
+                                backoffSeconds=self.backoffSeconds)
+
+    def state(self, modelName: str) -> ModelState:
+        key = modelName.lower()
+        if key not in self.states:
+            self.states[key] = ModelState(self.rateLimits.get(key, RateLimit()), self.initialConcurrency, self.maxConcurrency)
+        return self.states[key]
+
+    async def run(self, modelName: str, connector: Connector, logPath: Path, hardened: bool) -> tuple[list[LLMAnswer], float]:
+        if isinstance(connector, CachedConnector):
+            # Cache hits are answered before any budget or concurrency slot is taken, only misses are scheduled.
+            key, cached = connector.lookup(logPath, hardened)
+            if cached is not None:
+                self.cached += 1
+                return cached
+            result = await self.run(modelName, connector.connector, logPath, hardened)
+            connector.cache.put(key, connector.modelName, hardened, result)
+            return result
+
+        state = self.state(modelName)
+        tokens = estimate_tokens(connector.prepare_log_with_line_numbers(logPath.read_text(encoding="utf-8")))
+
+        attempt = 0
+        while True:
+            await state.acquire_budget(tokens)
+            started = await state.concurrency.acquire()
+            try:
+                result = await connector.aconnect(logPath, hardened)
+            except RateLimitExceeded as e:
+                await state.concurrency.release()
+                state.concurrency.on_rate_limited(started)
+                self.rate_limited += 1
+
+                attempt += 1
+                if attempt > self.maxRetries != -1:
+                    raise
+                delay = e.retryAfter if e.retryAfter is not None else self.backoffSeconds * 2 ** (attempt - 1)
+                print(f"Rate limit for {modelName}, retry {attempt} in {delay:.1f}s (concurrency {int(state.concurrency.limit)})")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                await state.concurrency.release()
+                raise
+
+            await state.concurrency.release()
+            state.concurrency.on_success()
+            self.requests += 1
+            return result
+
+    def __str__(self) -> str:
+        limits = ", ".join(f"{name}: {int(state.concurrency.limit)}" for name, state in self.states.items())
+        return f"Requests: {self.requests}, Cached: {self.cached}, Rate-Limited: {self.rate_limited}, Concurrency: {{{limits}}}"
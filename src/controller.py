@@ -1,16 +1,29 @@
+import asyncio
+import contextvars
 import os
 import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable, Iterable, Iterator
 
 from dotenv import load_dotenv
 
-from connector import get_connector
+from connector import get_connector, Connector, BatchJob, ResponseCache, CachedConnector, RequestScheduler, RateLimit
 from injector import Injector
 from src.comparer import Comparer
 from src.sanitizer import Sanitizer
-from src.utils.fileHelper import read_lines, write_lines, ensure_dir
+from src.utils.fileHelper import write_lines, ensure_dir
+from src.utils.logRowHelper import TimestampIndex
 from src.utils.models import AttackPayloads, InjectionRecord, SanitizeRecord, LLMAnswer
+from src.utils.pipeline import background_map
+from src.utils.promptEncoding import encoding_stats
+from src.utils.resultStore import ResultStore
+from src.utils.resultStream import stream_stats
+from src.utils.runManifest import RunManifest
 from src.utils.splitter import Splitter
+from src.utils.timing import StageTimer, span, current_timer
 
 
 def env_path(name: str) -> Path:
@@ -20,13 +33,29 @@ def env_path(name: str) -> Path:
     return Path(v).resolve()
 
 
-def env_int(name: str) -> int:
+def env_int(name: str, default: int | None = None) -> int:
     v = os.getenv(name)
     if not v:
+        if default is not None:
+            return default
         raise RuntimeError(f"env {name} fehlt")
     return int(v)
 
 
+def env_flag(name: str, default: bool) -> bool:
+    v = os.getenv(name)
+    if not v:
+        return default
+    return v.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_str(name: str, default: str) -> str:
+    v = os.getenv(name)
+    if not v or v.strip() == "":
+        return default
+    return v.strip()
+
+
 def env_str_list(name: str) -> list[str]:
     v = os.getenv(name)
     if not v or v.strip() == "":
@@ -38,10 +67,53 @@ load_dotenv()
 model_names = env_str_list("MODEL_NAMES")
 hardened_model_names = env_str_list("HARDENED_MODEL_NAMES")
 seed = env_int("SEED")
+llm_mode = env_str("LLM_MODE", "serial").lower()
+
+
+def create_response_cache() -> ResponseCache | None:
+    cache_mode = env_str("CACHE_MODE", "use").lower()
+    if not os.getenv("CACHE_DIR") or cache_mode == "off":
+        return None
+    max_age_days = env_int("CACHE_MAX_AGE_DAYS", -1)
+    return ResponseCache(env_path("CACHE_DIR"),
+                         cache_mode,
+                         maxBytes=env_int("CACHE_MAX_BYTES", -1),
+                         maxAgeSeconds=max_age_days * 86400 if max_age_days != -1 else -1)
+
+
+response_cache = create_response_cache()
 
 
-def sanitize_file(injectedLines: list[str], injections: list[InjectionRecord], sanitizer: Sanitizer) -> list[
-    SanitizeRecord]:
+def env_rate_limits(name: str) -> dict[str, RateLimit]:
+    limits: dict[str, RateLimit] = {}
+    for entry in env_str_list(name):
+        model_name, _, budget = entry.partition("=")
+        rpm, _, tpm = budget.partition("/")
+        limits[model_name.strip()] = RateLimit(float(rpm) if rpm.strip() else -1, float(tpm) if tpm.strip() else -1)
+    return limits
+
+
+def create_request_scheduler() -> RequestScheduler | None:
+    if llm_mode != "scheduled":
+        return None
+    return RequestScheduler(env_rate_limits("RATE_LIMITS"),
+                            initialConcurrency=env_int("SCHEDULER_INITIAL_CONCURRENCY", 4),
+                            maxConcurrency=env_int("SCHEDULER_MAX_CONCURRENCY", 64),
+                            maxRetries=env_int("SCHEDULER_MAX_RETRIES", 10))
+
+
+request_scheduler = create_request_scheduler()
+
+
+def get_llm_connector(model_name: str) -> Connector:
+    connector = get_connector(model_name)
+    if response_cache is None:
+        return connector
+    return CachedConnector(connector, model_name, response_cache)
+
+
+def sanitize_file(injectedLines: list[str], injections: list[InjectionRecord], sanitizer: Sanitizer,
+                  timestamps: TimestampIndex | None = None) -> list[SanitizeRecord]:
     if not injectedLines:
         raise ValueError(f"Injected Lines are empty")
 
@@ -50,91 +122,508 @@ def sanitize_file(injectedLines: list[str], injections: list[InjectionRecord], s
 
     maximum_file_sanitized = env_int("MAXIMUM_FILE_SANITIZED")
 
-    result = sanitizer.file_sanitize(injectedLines, injections, env_path("CAMO_DIR").joinpath("camo_file.txt"), "start",
-                                     maximum_file_sanitized)
+    timestamps = timestamps or TimestampIndex()
+
+    with span("file_sanitize"):
+        result = sanitizer.file_sanitize(injectedLines, injections, env_path("CAMO_DIR").joinpath("camo_file.txt"), "start",
+                                         maximum_file_sanitized, timestamps)
 
-    result.append(sanitizer.multi_sanitize(injectedLines, injections, env_path("CAMO_DIR").joinpath("camo_part_before.txt"),True))
+    with span("multi_sanitize", mode="before"):
+        result.append(sanitizer.multi_sanitize(injectedLines, injections, env_path("CAMO_DIR").joinpath("camo_part_before.txt"),True, timestamps))
 
-    result.append(sanitizer.multi_sanitize(injectedLines, injections, env_path("CAMO_DIR").joinpath("camo_part_after.txt"),False))
+    with span("multi_sanitize", mode="after"):
+        result.append(sanitizer.multi_sanitize(injectedLines, injections, env_path("CAMO_DIR").joinpath("camo_part_after.txt"),False, timestamps))
 
     result.sort(key=lambda x: x.id)
 
     return result
 
 
-def llm_log_analyse(filePath: Path) -> dict[str, tuple[list[LLMAnswer], float]]:
+AnswerRecorder = Callable[[Path, str, tuple[list[LLMAnswer], float]], None]
+
+
+def llm_jobs(skip: Iterable[str] = ()) -> list[tuple[str, str, bool]]:
+    jobs = [(f"{model_name}", model_name, False) for model_name in model_names]
+    jobs += [(f"{model_name}_hardened", model_name, True) for model_name in hardened_model_names]
+    return [job for job in jobs if job[0] not in skip]
+
+
+def connect_and_record(connector: Connector, filePath: Path, key: str, hardened: bool,
+                       record: AnswerRecorder | None) -> tuple[list[LLMAnswer], float]:
+    with span("analyse", variant=filePath.stem, model=key):
+        result = connector.connect(filePath, hardened)
+    if record is not None:
+        record(filePath, key, result)
+    return result
+
+
+async def aconnect_and_record(coroutine, filePath: Path, key: str,
+                              record: AnswerRecorder | None) -> tuple[list[LLMAnswer], float]:
+    with span("analyse", variant=filePath.stem, model=key):
+        result = await coroutine
+    if record is not None:
+        record(filePath, key, result)
+    return result
+
+
+def llm_log_analyse(filePath: Path,
+                    skip: Iterable[str] = (),
+                    record: AnswerRecorder | None = None) -> dict[str, tuple[list[LLMAnswer], float]]:
+    if llm_mode == "threads":
+        return llm_log_analyse_threaded(filePath, skip, record)
+    if llm_mode in ("async", "scheduled"):
+        return run_async(allm_log_analyse(filePath, skip, record))
+    if llm_mode != "serial":
+        raise ValueError(f"Invalid LLM_MODE: {llm_mode}")
+
     answers: dict[str, tuple[list[LLMAnswer], float]] = {}
-    for model_name in model_names:
-        connector = get_connector(model_name)
+    for key, model_name, hardened in llm_jobs(skip):
+        connector = get_llm_connector(model_name)
         print(f"Connecting {model_name} to {filePath}")
-        answers.update({f"{model_name}": connector.connect(filePath, False)})
+        answers[key] = connect_and_record(connector, filePath, key, hardened, record)
+
+    return answers
+
+
+def llm_log_analyse_threaded(filePath: Path,
+                             skip: Iterable[str] = (),
+                             record: AnswerRecorder | None = None) -> dict[str, tuple[list[LLMAnswer], float]]:
+    jobs = llm_jobs(skip)
+    if not jobs:
+        return {}
+
+    # The registry is not thread safe, so all connectors are resolved before the first request starts.
+    connectors = [get_llm_connector(model_name) for _, model_name, _ in jobs]
+
+    answers: dict[str, tuple[list[LLMAnswer], float]] = {}
+    with ThreadPoolExecutor(max_workers=env_int("LLM_MAX_WORKERS", len(jobs))) as executor:
+        futures = []
+        for (key, model_name, hardened), connector in zip(jobs, connectors):
+            print(f"Connecting {model_name} to {filePath}")
+            futures.append((key, executor.submit(contextvars.copy_context().run, connect_and_record, connector, filePath, key, hardened, record)))
+
+        # Collected in job order, so the dict matches a serial run key for key.
+        for key, future in futures:
+            answers[key] = future.result()
+
+    return answers
+
+
+async_runner: asyncio.Runner | None = None
+
+
+def run_async(coroutine):
+    # A single loop for the whole run, the async clients keep their connection pools bound to it.
+    global async_runner
+    if async_runner is None:
+        async_runner = asyncio.Runner()
+    # The runner would otherwise keep the context of its first call, spans need the current one.
+    return async_runner.run(coroutine, context=contextvars.copy_context())
 
-    for model_name in hardened_model_names:
-        connector = get_connector(model_name)
+
+async def allm_log_analyse(filePath: Path,
+                           skip: Iterable[str] = (),
+                           record: AnswerRecorder | None = None) -> dict[str, tuple[list[LLMAnswer], float]]:
+    jobs = llm_jobs(skip)
+    connectors = [get_llm_connector(model_name) for _, model_name, _ in jobs]
+
+    coroutines = []
+    for (key, model_name, hardened), connector in zip(jobs, connectors):
         print(f"Connecting {model_name} to {filePath}")
-        answers.update({f"{model_name}_hardened": connector.connect(filePath, True)})
+        if request_scheduler is not None:
+            coroutine = request_scheduler.run(model_name, connector, filePath, hardened)
+        else:
+            coroutine = connector.aconnect(filePath, hardened)
+        coroutines.append(aconnect_and_record(coroutine, filePath, key, record))
+    results = await asyncio.gather(*coroutines)
+
+    answers: dict[str, tuple[list[LLMAnswer], float]] = {}
+    for (key, _, _), result in zip(jobs, results):
+        answers[key] = result
+
+    return answers
 
+
+def llm_log_analyse_all(filePaths: list[Path],
+                        skip: list[set[str]] | None = None,
+                        record: AnswerRecorder | None = None) -> list[dict[str, tuple[list[LLMAnswer], float]]]:
+    skip = skip or [set() for _ in filePaths]
+    if llm_mode in ("async", "scheduled"):
+        return run_async(allm_log_analyse_all(filePaths, skip, record))
+
+    answers: list[dict[str, tuple[list[LLMAnswer], float]]] = []
+    for filePath, skipped in zip(filePaths, skip):
+        print(f"Analysing {filePath}")
+        answers.append(llm_log_analyse(filePath, skipped, record))
     return answers
 
 
-def main(seed: int) -> None:
+async def allm_log_analyse_all(filePaths: list[Path],
+                               skip: list[set[str]] | None = None,
+                               record: AnswerRecorder | None = None) -> list[dict[str, tuple[list[LLMAnswer], float]]]:
+    skip = skip or [set() for _ in filePaths]
+    for filePath in filePaths:
+        print(f"Analysing {filePath}")
+    return list(await asyncio.gather(*[allm_log_analyse(filePath, skipped, record)
+                                       for filePath, skipped in zip(filePaths, skip)]))
+
+
+def close_async_runner() -> None:
+    global async_runner
+    if async_runner is not None:
+        async_runner.close()
+        async_runner = None
+
+
+@dataclass(frozen=True)
+class PackageJob:
+    seed: int
+    fileStem: str
+    index: int
+    lines: list[str]
+    injectSeed: int
+    sanitizeSeed: int
+
+
+@dataclass(frozen=True)
+class PreparedPackage:
+    job: PackageJob
+    injections: list[InjectionRecord]
+    injectedPath: Path
+    sanitizeRecords: list[SanitizeRecord]
+    sanitizedPaths: list[Path]
+
+
+def prepare_package(job: PackageJob, injector: Injector, timer: StageTimer) -> PreparedPackage:
+    # Shared by the injector and every sanitize mode of this package.
+    timestamps = TimestampIndex()
+
+    with timer.stage("inject", file=job.fileStem, package=job.index):
+        injections, injectedLines = injector.inject(job.lines, env_int("PER_ATTACK"), seed=job.injectSeed, timestamps=timestamps,
+                                                    perLineSeeds=env_flag("PER_LINE_SEEDS", True))
+
+    with timer.stage("write", file=job.fileStem, package=job.index, variant="injected"):
+        ensure_dir(env_path("INJECTED_DIR"))
+        write_path = env_path("INJECTED_DIR").joinpath(f"{job.fileStem}_injected_package{job.index}.log")
+        write_lines(write_path, injectedLines)
+
+    print(f"Wrote {len(injections)} injections to {write_path}")
+
+    with timer.stage("sanitize", file=job.fileStem, package=job.index):
+        results = sanitize_file(injectedLines, injections,
+                                Sanitizer(seed=job.sanitizeSeed, perLineSeeds=env_flag("PER_LINE_SEEDS", True)), timestamps)
+
+    with timer.stage("write", file=job.fileStem, package=job.index, variant="sanitized"):
+        write_path_sanitized = env_path("SANITIZED_DIR").joinpath(f"{write_path.stem}")
+        ensure_dir(write_path_sanitized)
+        sanitized_paths: list[Path] = []
+        for result in results:
+            sanitized_path = write_path_sanitized.joinpath(f"sanitized_{result.id}.log")
+            write_lines(sanitized_path, result.lines)
+            sanitized_paths.append(sanitized_path)
+
+    return PreparedPackage(job, injections, write_path, results, sanitized_paths)
+
+
+run_manifest: RunManifest | None = None
+
+
+def open_run_manifest(path: Path | None, fresh: bool = False, write: bool = True) -> None:
+    global run_manifest
+    run_manifest = RunManifest(path, fresh, write) if path is not None else None
+
+
+def package_variants(prepared: PreparedPackage) -> list[tuple[Path, str]]:
+    # The injected file first, then the sanitized variants in the order of their records.
+    return [(prepared.injectedPath, "injected"),
+            *((path, f"sanitized_{record.id}") for path, record in zip(prepared.sanitizedPaths, prepared.sanitizeRecords))]
+
+
+def analyse_package(prepared: PreparedPackage,
+                    timer: StageTimer,
+                    known: list[dict[str, tuple[list[LLMAnswer], float]]] | None = None) -> list[dict[str, tuple[list[LLMAnswer], float]]]:
+    variants = package_variants(prepared)
+    paths = [path for path, _ in variants]
+    known = [dict(answers) for answers in known] if known is not None else [{} for _ in paths]
+    with timer.stage("llm", file=prepared.job.fileStem, package=prepared.job.index):
+        recorder: AnswerRecorder | None = None
+        if run_manifest is not None:
+            job = prepared.job
+            names = dict(variants)
+            log_hashes = {path: RunManifest.hash_log(path) for path in paths}
+
+            def record(filePath: Path, key: str, result: tuple[list[LLMAnswer], float]) -> None:
+                run_manifest.put(job.fileStem, job.index, names[filePath], key, log_hashes[filePath], result)
+
+            recorder = record
+            for answers, (path, variant) in zip(known, variants):
+                done = run_manifest.done(job.fileStem, job.index, variant, log_hashes[path])
+                for key, result in answers.items():
+                    if key not in done:
+                        record(path, key, result)
+                answers.update(done)
+
+        fresh = llm_log_analyse_all(paths, [set(answers) for answers in known], recorder)
+
+        # Back in job order, the comparer writes and aggregates in the order of the keys.
+        return [{key: known_answers[key] if key in known_answers else fresh_answers[key] for key, _, _ in llm_jobs()}
+                for known_answers, fresh_answers in zip(known, fresh)]
+
+
+def analyse_packages_batched(preparedPackages: list[PreparedPackage],
+                             timer: StageTimer) -> list[list[dict[str, tuple[list[LLMAnswer], float]]]]:
+    # Every ChatGPT request of the packages goes into one batch job, the other models and everything
+    # the batch could not answer run through analyse_package as usual. Cache hits never enter the batch.
+    from connector.chatGPT import ChatGPT, openai_client
+
+    batch = BatchJob(openai_client(),
+                     env_path("INJECTED_DIR").joinpath("batches"),
+                     pollSeconds=env_int("LLM_BATCH_POLL_SECONDS", 30),
+                     completionWindow=env_str("LLM_BATCH_COMPLETION_WINDOW", "24h"))
+    requests: dict[str, tuple[int, int, str, ChatGPT, str | None, str, bool]] = {}
+    known = [[{} for _ in package_variants(prepared)] for prepared in preparedPackages]
+
+    with timer.stage("batch"):
+        for package_no, prepared in enumerate(preparedPackages):
+            job = prepared.job
+            for variant_no, (path, variant) in enumerate(package_variants(prepared)):
+                done = {}
+                if run_manifest is not None:
+                    done = run_manifest.done(job.fileStem, job.index, variant, RunManifest.hash_log(path), count=False)
+                for key, model_name, hardened in llm_jobs(done):
+                    cached_connector = get_llm_connector(model_name)
+                    connector = get_connector(model_name)
+                    if not isinstance(connector, ChatGPT):
+                        continue
+                    cache_key = None
+                    if isinstance(cached_connector, CachedConnector):
+                        cache_key, cached = cached_connector.lookup(path, hardened)
+                        if cached is not None:
+                            known[package_no][variant_no][key] = cached
+                            continue
+                    custom_id = f"{job.fileStem}/{job.index}/{variant}/{key}"
+                    batch.add(custom_id, connector.batch_body(path, hardened))
+                    requests[custom_id] = (package_no, variant_no, key, connector, cache_key, model_name, hardened)
+
+        results, errors = batch.run()
+
+    # The batch has no per request timing, every request gets an equal share of the time until it finished.
+    time_needed = batch.seconds / len(batch) if len(batch) else 0.0
+    for custom_id, body in results.items():
+        package_no, variant_no, key, connector, cache_key, model_name, hardened = requests[custom_id]
+        result = (connector.parse_batch_body(body), time_needed)
+        known[package_no][variant_no][key] = result
+        if cache_key is not None:
+            response_cache.put(cache_key, model_name, hardened, result)
+
+    for custom_id, error in errors.items():
+        print(f"Batch request {custom_id} failed, sending it directly: {error}")
+
+    return [analyse_package(prepared, timer, package_known) for prepared, package_known in zip(preparedPackages, known)]
+
+
+def compare_package(prepared: PreparedPackage,
+                    answers: list[dict[str, tuple[list[LLMAnswer], float]]],
+                    comparer: Comparer,
+                    timer: StageTimer) -> None:
+    job = prepared.job
+    with timer.stage("compare", file=job.fileStem, package=job.index):
+        write_path_output = env_path("OUTPUT_DIR").joinpath(f"{job.seed}").joinpath(f"{job.fileStem}_{job.index}")
+        ensure_dir(write_path_output)
+        comparer.compare(write_path_output, job.index, prepared.injections, answers[0], prepared.sanitizeRecords, answers[1:])
+
+
+def process_package(job: PackageJob, injector: Injector, comparer: Comparer, timer: StageTimer) -> None:
+    prepared = prepare_package(job, injector, timer)
+    answers = analyse_package(prepared, timer)
+    compare_package(prepared, answers, comparer, timer)
+
+
+worker_injector: Injector | None = None
+
+
+def process_package_in_worker(job: PackageJob) -> tuple[Comparer, StageTimer, tuple[list[str], int]]:
+    global worker_injector
+    if worker_injector is None:
+        worker_injector = Injector(AttackPayloads(env_path("ATTACKS_DIR")))
+
+    comparer = Comparer(env_flag("TEXT_REPORTS", True), collect=env_flag("RESULT_STORE", True))
+    timer = StageTimer()
+    with timer.active():
+        process_package(job, worker_injector, comparer, timer)
+    return comparer, timer, run_manifest.take() if run_manifest is not None else ([], 0)
+
+
+def init_package_worker(manifestPath: Path | None, workers: int) -> None:
+    # Every worker process has its own scheduler, with the full RATE_LIMITS each of them would send
+    # `workers` times the configured quota. Each one gets an even share of the budgets and the concurrency.
+    global request_scheduler
+    open_run_manifest(manifestPath, False, False)
+    if request_scheduler is not None:
+        request_scheduler = request_scheduler.share(workers)
+
+
+def merge_worker_result(result: tuple[Comparer, StageTimer, tuple[list[str], int]], comparer: Comparer, timer: StageTimer) -> None:
+    worker_comparer, worker_timer, manifest_update = result
+    comparer.merge(worker_comparer)
+    timer.merge(worker_timer)
+    if run_manifest is not None:
+        run_manifest.merge(*manifest_update)
+
+
+def process_packages_in_pool(executor: ProcessPoolExecutor,
+                             jobs: Iterator[PackageJob],
+                             workers: int,
+                             comparer: Comparer,
+                             timer: StageTimer) -> None:
+    # Only a bounded number of packages is in flight and results are merged in package order,
+    # so the aggregates for completeTest add up in exactly the same order as a serial run.
+    pending: deque[Future] = deque()
+    for job in jobs:
+        pending.append(executor.submit(process_package_in_worker, job))
+        if len(pending) >= workers * 2:
+            merge_worker_result(pending.popleft().result(), comparer, timer)
+
+    while pending:
+        merge_worker_result(pending.popleft().result(), comparer, timer)
+
+
+def process_packages_pipelined(jobs: Iterator[PackageJob],
+                               injector: Injector,
+                               comparer: Comparer,
+                               timer: StageTimer,
+                               queueSize: int) -> None:
+    # prepare -> analyse -> compare, each in its own thread with bounded queues in between,
+    # so generating the next package and comparing the last one overlap with the LLM requests.
+    prepared = background_map(lambda job: prepare_package(job, injector, timer), jobs, queueSize, "prepare")
+    analysed = background_map(lambda p: (p, analyse_package(p, timer)), prepared, queueSize, "analyse")
+    for prepared_package, answers in analysed:
+        compare_package(prepared_package, answers, comparer, timer)
+
+
+def process_packages_batched(jobs: Iterator[PackageJob],
+                             injector: Injector,
+                             comparer: Comparer,
+                             timer: StageTimer) -> None:
+    prepared = [prepare_package(job, injector, timer) for job in jobs]
+    for prepared_package, answers in zip(prepared, analyse_packages_batched(prepared, timer)):
+        compare_package(prepared_package, answers, comparer, timer)
+
+
+def main(seed: int, timer: StageTimer | None = None) -> StageTimer:
+    timer = timer or StageTimer()
+    timer_token = current_timer.set(timer)
     rng = random.Random(seed)
 
     splitter_packet_count = env_int("SPLITTER_PACKET_COUNT")
     splitter_packet_site = env_int("SPLITTER_PACKET_SIZE")
-    per_attack = env_int("PER_ATTACK")
-
-    splitter = Splitter(splitter_packet_count, splitter_packet_site)
+    package_workers = env_int("PACKAGE_WORKERS", 1)
+    pipeline_queue_size = env_int("PIPELINE_QUEUE_SIZE", 0)
+    # One provider batch job per input file instead of one request per package, for runs nobody waits on.
+    llm_batch = env_flag("LLM_BATCH", False)
+    manifest_mode = env_str("RUN_MANIFEST", "resume").lower()
+    if manifest_mode not in ("resume", "fresh", "off"):
+        raise ValueError(f"Invalid RUN_MANIFEST: {manifest_mode}")
+
+    splitter_token_budget = env_int("SPLITTER_TOKEN_BUDGET", -1)
+    splitter_overhead_tokens = 0
+    if splitter_token_budget != -1:
+        # Every model gets the same packets, so the largest static prompt decides. The reserve leaves room
+        # for the injected and camouflage lines that are added after splitting.
+        splitter_overhead_tokens = max((get_llm_connector(model_name).prompt_overhead_tokens(hardened)
+                                        for _, model_name, hardened in llm_jobs()), default=0)
+        splitter_overhead_tokens += env_int("SPLITTER_TOKEN_RESERVE", 0)
+
+    splitter = Splitter(splitter_packet_count, splitter_packet_site, splitter_token_budget, splitter_overhead_tokens)
     injector = Injector(AttackPayloads(env_path("ATTACKS_DIR")))
-    sanitizer = Sanitizer(seed=rng.randint(0, 1000000))
-    comparer = Comparer()
+    # Every package gets its own sanitizer seed, drawn up front, so packages can run in any process.
+    sanitizer_rng = random.Random(rng.randint(0, 1000000))
+
+    # Every comparison row of the run goes to one SQLite file, the .txt reports can be rendered from it later.
+    result_store = None
+    if env_flag("RESULT_STORE", True):
+        result_store = ResultStore(env_path("OUTPUT_DIR").joinpath(f"{seed}").joinpath("results.sqlite"), fresh=True)
+    comparer = Comparer(env_flag("TEXT_REPORTS", True), result_store)
+
+    # Finished requests are kept under OUTPUT_DIR/<seed>, a rerun with the same seed only sends what is missing.
+    manifest_path = None
+    if manifest_mode != "off":
+        manifest_path = env_path("OUTPUT_DIR").joinpath(f"{seed}").joinpath("manifest.jsonl")
+    open_run_manifest(manifest_path, manifest_mode == "fresh")
+
+    executor = None
+    if package_workers > 1:
+        executor = ProcessPoolExecutor(max_workers=package_workers, initializer=init_package_worker,
+                                       initargs=(manifest_path, package_workers))
+        if request_scheduler is not None:
+            print(f"Request Scheduler: RATE_LIMITS und Concurrency werden auf {package_workers} Worker aufgeteilt")
 
     for filePath in env_path("INPUT_DIR").iterdir():
         if filePath.suffix != ".txt" and filePath.suffix != ".log":
             continue
 
-        lines = read_lines(filePath)
-        if not lines:
+        if filePath.stat().st_size == 0:
             raise ValueError(f"{filePath} is empty")
 
-        print(f"Processing {filePath}")
+        with timer.stage("file", file=filePath.stem):
+            print(f"Processing {filePath}")
+
+            packages = splitter.split_file(filePath)
+            jobs = (PackageJob(seed, filePath.stem, i, package, rng.randint(0, 1000000), sanitizer_rng.randint(0, 1000000))
+                    for i, package in enumerate(timer.iterate("split", packages, file=filePath.stem)))
+
+            if llm_batch:
+                process_packages_batched(jobs, injector, comparer, timer)
+            elif executor is not None:
+                process_packages_in_pool(executor, jobs, package_workers, comparer, timer)
+            elif pipeline_queue_size > 0:
+                process_packages_pipelined(jobs, injector, comparer, timer, pipeline_queue_size)
+            else:
+                for job in jobs:
+                    process_package(job, injector, comparer, timer)
+
+            with timer.stage("compare"):
+                write_path_output = env_path("OUTPUT_DIR").joinpath(f"{seed}")
+                ensure_dir(write_path_output)
+                comparer.completeTest(write_path_output, filePath.stem)
+        print("")
+        print(f"Finished {filePath}")
+        print("")
+        print("#"*50)
 
-        packages = splitter.split(lines)
+    if executor is not None:
+        executor.shutdown()
 
-        for i, package in enumerate(packages):
-            injections, injectedLines = injector.inject(package, per_attack, seed=rng.randint(0, 1000000))
+    if response_cache is not None:
+        print(f"Response Cache: {response_cache}")
 
-            ensure_dir(env_path("INJECTED_DIR"))
-            write_path = env_path("INJECTED_DIR").joinpath(f"{filePath.stem}_injected_package{i}.log")
-            write_lines(write_path, injectedLines)
+    if run_manifest is not None:
+        print(f"Run Manifest: {run_manifest}")
 
-            llmAnwersInjected = llm_log_analyse(write_path)
+    if env_str("PROMPT_ENCODING", "plain").lower() == "compact":
+        print(f"Prompt Encoding: {encoding_stats}")
 
-            print(f"Wrote {len(injections)} injections to {write_path}")
+    if env_flag("LLM_STREAM", False):
+        print(f"Streaming:\n{stream_stats}")
 
-            results = sanitize_file(injectedLines, injections, sanitizer)
+    if result_store is not None:
+        print(f"Result Store: {result_store}")
+        result_store.close()
 
-            write_path_sanitized = env_path("SANITIZED_DIR").joinpath(f"{write_path.stem}")
-            ensure_dir(write_path_sanitized)
-            for result in results:
-                write_path = write_path_sanitized.joinpath(f"sanitized_{result.id}.log")
-                write_lines(write_path, result.lines)
+    if request_scheduler is not None and executor is None:
+        # With workers the parent's scheduler never sends anything, their counts stay in the worker processes.
+        print(f"Request Scheduler: {request_scheduler}")
 
-            llmAnswersListSanatized: list[dict[str, tuple[list[LLMAnswer], float]]] = []
-            for sanitizPath in write_path_sanitized.iterdir():
-                print(f"Analysing {sanitizPath}")
-                llmAnswersListSanatized.append(llm_log_analyse(sanitizPath))
+    close_async_runner()
 
-            write_path_output = env_path("OUTPUT_DIR").joinpath(f"{seed}").joinpath(f"{filePath.stem}_{i}")
-            ensure_dir(write_path_output)
-            comparer.compare(write_path_output, i, injections, llmAnwersInjected, results, llmAnswersListSanatized)
+    if env_flag("TIMING_SPANS", True):
+        write_path_timings = env_path("OUTPUT_DIR").joinpath(f"{seed}")
+        ensure_dir(write_path_timings)
+        timer.export(write_path_timings.joinpath("timings.json"), write_path_timings.joinpath("timings.csv"))
+    current_timer.reset(timer_token)
+
+    return timer
 
-        write_path_output = env_path("OUTPUT_DIR").joinpath(f"{seed}")
-        ensure_dir(write_path_output)
-        comparer.completeTest(write_path_output, filePath.stem)
-        print("")
-        print(f"Finished {filePath}")
-        print("")
-        print("#"*50)
 
-main(seed)
+if __name__ == "__main__":
+    main(seed)
@@ -1,6 +1,6 @@
 import random
 
-from src.utils.logRowHelper import build_log_line_with_payload
+from src.utils.logRowHelper import build_log_lines_with_payloads, TimestampIndex
 from src.utils.models import AttackPayloads, InjectionRecord, AttackType
 
 
@@ -11,7 +11,9 @@ class Injector:
     def inject(self,
                lines: list[str],
                per_Attack: int,
-               seed: int = random.randint(0, 1000000)) -> tuple[list[InjectionRecord], list[str]]:
+               seed: int = random.randint(0, 1000000),
+               timestamps: TimestampIndex | None = None,
+               perLineSeeds: bool = True) -> tuple[list[InjectionRecord], list[str]]:
         if not lines:
             raise ValueError(f"Input Lines are empty")
 
@@ -19,6 +21,7 @@ class Injector:
             raise ValueError(f"Not enough lines for {len(self.attacks.payloads)} attacks")
 
         rng = random.Random(seed)
+        timestamps = timestamps or TimestampIndex()
         candidate_positions = list(range(len(lines)))
         rng.shuffle(candidate_positions)
 
@@ -33,16 +36,36 @@ class Injector:
                     insertions.append((position, payload, attackType, 1))
 
         insertions.sort(key=lambda x: x[0])
-        offset = 0
+
+        # Lines of one DoS block are generated back to front, exactly like repeated inserts at the same position
+        # would place them, so each one is bounded by the line generated before it. Round r builds the r-th line
+        # of every block in one batch. Per-line seeds are drawn in the order the lines used to be built in.
+        seeds = [[rng.randint(0, 1000000) for _ in range(count)] for _, _, _, count in insertions] if perLineSeeds else None
+        line_rng = None if perLineSeeds else random.Random(rng.randint(0, 1000000))
+        bounds = [(timestamps.time_of(lines[lineID - 1]) if lineID > 0 else None, timestamps.time_of(lines[lineID]))
+                  for lineID, _, _, _ in insertions]
+        blocks: list[list[str]] = [[] for _ in insertions]
+        for r in range(max((count for _, _, _, count in insertions), default=0)):
+            active = [b for b, (_, _, _, count) in enumerate(insertions) if count > r]
+            built = build_log_lines_with_payloads([insertions[b][1] for b in active],
+                                                  [bounds[b] for b in active],
+                                                  seeds=[seeds[b][r] for b in active] if seeds else None,
+                                                  rng=line_rng)
+            for b, line in zip(active, built):
+                blocks[b].append(line)
+                bounds[b] = (bounds[b][0], timestamps.time_of(line))
+
+        # Every injection point is a distinct original line, so the output can be built in one merge pass
+        # instead of shifting the list on every insert.
         records: list[InjectionRecord] = []
-        for lineID, attackPayload, attackType, count in insertions:
-            position = lineID + offset
-            for i in range(count):
-                lines.insert(position, str(build_log_line_with_payload(attackPayload,
-                                                                       seed=rng.randint(0, 1000000),
-                                                                       line_before=lines[position - 1] if position > 0 else None,
-                                                                       line_after=lines[position] if position < len(lines) else None)))
-                offset += 1
-            records.append(InjectionRecord(position + 1, attackType, attackPayload))
-
-        return records, lines
+        output: list[str] = []
+        next_line = 0
+        for (lineID, attackPayload, attackType, count), block in zip(insertions, blocks):
+            output.extend(lines[next_line:lineID])
+            next_line = lineID
+
+            records.append(InjectionRecord(len(output) + 1, attackType, attackPayload))
+            output.extend(reversed(block))
+        output.extend(lines[next_line:])
+
+        return records, output
@@ -0,0 +1,24 @@
+import argparse
+from pathlib import Path
+
+from src.comparer import render_reports
+from src.utils.resultStore import ResultStore
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Renders the .txt reports of a run from its results.sqlite.")
+    parser.add_argument("store", type=Path)
+    parser.add_argument("--output", type=Path, default=None, help="defaults to the directory of the store")
+    args = parser.parse_args()
+
+    store_path = args.store.resolve()
+    if not store_path.exists():
+        raise FileNotFoundError(f"{store_path} does not exist")
+
+    store = ResultStore(store_path)
+    render_reports(store, (args.output or store_path.parent).resolve())
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
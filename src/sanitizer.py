@@ -2,23 +2,29 @@ import random
 from pathlib import Path
 from typing import Literal
 
-from src.utils.logRowHelper import build_log_line_with_payload
+from src.utils.logRowHelper import build_log_lines_with_payloads, TimestampIndex
 from src.utils.fileHelper import read_lines, ensure_dir, write_lines
+from src.utils.insertionSequence import InsertionSequence
+from src.utils.lineOverlay import LineOverlay
 from src.utils.models import InjectionRecord, CamouflageRecord, SanitizeRecord
 
 InsertMode = Literal["start", "end", "random"]
 
 
 class Sanitizer:
-    def __init__(self, seed: int = random.randint(0, 1000000)):
+    def __init__(self, seed: int = random.randint(0, 1000000), perLineSeeds: bool = True):
+        # perLineSeeds keeps the generated lines identical to earlier runs with the same seed, without it
+        # all lines of a call are drawn from self.rng.
         self.rng = random.Random(seed)
+        self.perLineSeeds = perLineSeeds
 
     def file_sanitize(self,
                       lines: list[str],
                       injections: list[InjectionRecord],
                       camoFilePath: Path,
                       mode: InsertMode,
-                      maximumCount: int = -1) -> list[SanitizeRecord]:
+                      maximumCount: int = -1,
+                      timestamps: TimestampIndex | None = None) -> list[SanitizeRecord]:
         camoLines = read_lines(camoFilePath)
         if not camoLines:
             raise ValueError(f"{camoFilePath} is empty")
@@ -27,9 +33,13 @@ class Sanitizer:
             raise ValueError(f"Input Lines are empty")
 
         result: list[SanitizeRecord] = []
+        timestamps = timestamps or TimestampIndex()
 
         self.rng.shuffle(camoLines)
 
+        # Every variant is placed into the untouched package lines, so all camouflage lines are built in one batch.
+        inserts: list[tuple[int, str]] = []
+        seeds: list[int] = []
         for i, camo in enumerate(camoLines, start=1):
             if i > maximumCount != -1: break
             if mode == "start":
@@ -41,12 +51,20 @@ class Sanitizer:
             else:
                 raise ValueError(f"Invalid mode: {mode}")
 
-            copy_lines = lines[:]
-            logLine = build_log_line_with_payload(camo,
-                                                  seed=self.rng.randint(0, 1000000),
-                                                  line_before=lines[insert_index - 1] if insert_index > 0 else None,
-                                                  line_after=lines[insert_index] if insert_index < len(lines) else None)
-            copy_lines.insert(insert_index, str(logLine))
+            inserts.append((insert_index, camo))
+            if self.perLineSeeds:
+                seeds.append(self.rng.randint(0, 1000000))
+
+        logLines = build_log_lines_with_payloads([camo for _, camo in inserts],
+                                                 [(timestamps.time_of(lines[insert_index - 1]) if insert_index > 0 else None,
+                                                   timestamps.time_of(lines[insert_index]) if insert_index < len(lines) else None)
+                                                  for insert_index, _ in inserts],
+                                                 seeds=seeds if self.perLineSeeds else None,
+                                                 rng=self.rng)
+
+        for i, ((insert_index, camo), logLine) in enumerate(zip(inserts, logLines), start=1):
+            # Variants share the package lines and only keep their own inserted line.
+            overlay = LineOverlay(lines, [(insert_index, logLine)])
 
             updated: list[InjectionRecord] = []
             for record in injections:
@@ -55,7 +73,7 @@ class Sanitizer:
                     new_line_no += 1
                 updated.append(InjectionRecord(new_line_no, record.attack_type, record.payload, record.count))
 
-            result.append(SanitizeRecord(id = i + 1,injectionRecords = updated, camouflageRecords = [CamouflageRecord(insert_index + 1, camo)], lines = copy_lines))
+            result.append(SanitizeRecord(id = i + 1,injectionRecords = updated, camouflageRecords = [CamouflageRecord(insert_index + 1, camo)], lines = overlay))
 
 
         return result
@@ -65,7 +83,8 @@ class Sanitizer:
                        lines: list[str],
                        injections: list[InjectionRecord],
                        camoFilePath: Path,
-                       before: bool = True) -> SanitizeRecord:
+                       before: bool = True,
+                       timestamps: TimestampIndex | None = None) -> SanitizeRecord:
         if not lines:
             raise ValueError(f"Lines for multi_sanitize are empty")
 
@@ -73,10 +92,14 @@ class Sanitizer:
         if not camoLines:
             raise ValueError(f"{camoFilePath} is empty")
 
-        lines = lines[:]
+        sequence = InsertionSequence(lines)
+        timestamps = timestamps or TimestampIndex()
 
-        injectionsList: list[InjectionRecord] = []
-        camoList: list[CamouflageRecord] = []
+        # Record line numbers are resolved once at the end. Camouflage lines and (in before mode) injections
+        # move with the line they point at, which is exactly how shifting every "line_no > insert_index"
+        # on each insert behaved. In after mode injection numbers were never shifted and stay as computed.
+        injectionAnchors: list[tuple[InjectionRecord, int]] = []
+        camoAnchors: list[tuple[int, str, int]] = []
 
         camo_added = 0
         injections.sort(key=lambda x: x.line_no)
@@ -94,8 +117,8 @@ class Sanitizer:
                 new_injection_line = current_injection_line + 1
             else:
                 insert_index = current_injection_line + spaces
-                if insert_index > len(lines):
-                    insert_index = len(lines)
+                if insert_index > len(sequence):
+                    insert_index = len(sequence)
                 if last_camo_line > current_injection_line:
                     new_injection_line = current_injection_line - 1
                 else:
@@ -104,51 +127,24 @@ class Sanitizer:
                 last_camo_line = insert_index
 
             payload = self.rng.choice(camoLines)
-            logLine = build_log_line_with_payload(payload,
-                                                  seed=self.rng.randint(0, 1000000),
-                                                  line_before=lines[insert_index - 1] if insert_index > 0 else None,
-                                                  line_after=lines[insert_index] if insert_index < len(lines) else None)
-            lines.insert(insert_index, str(logLine))
-
-
-
-            updated_injectionsList: list[InjectionRecord] = []
-            if before:
-                for existing_injection in injectionsList:
-                    if existing_injection.line_no > insert_index:
-                        updated_injectionsList.append(InjectionRecord(
-                            existing_injection.line_no + 1,
-                            existing_injection.attack_type,
-                            existing_injection.payload,
-                            existing_injection.count
-                        ))
-                    else:
-                        updated_injectionsList.append(existing_injection)
-
-                injectionsList = updated_injectionsList
-
-            updated_camoList: list[CamouflageRecord] = []
-            for existing_camo in camoList:
-                if existing_camo.line_no > insert_index:
-                    updated_camoList.append(CamouflageRecord(
-                        existing_camo.line_no + 1,
-                        existing_camo.camouflage,
-                        existing_camo.spacing
-                    ))
-                else:
-                    updated_camoList.append(existing_camo)
-
-            camoList = updated_camoList
-
-            injectionsList.append(InjectionRecord(
-                new_injection_line,
-                injection.attack_type,
-                injection.payload,
-                injection.count
-            ))
-
-            camoList.append(CamouflageRecord(insert_index + 1, payload, spacing=spaces))
+            # Each line is bounded by lines inserted before it, these stay one at a time.
+            logLine = build_log_lines_with_payloads([payload],
+                                                    [(timestamps.time_of(sequence.line_at(insert_index - 1)) if insert_index > 0 else None,
+                                                      timestamps.time_of(sequence.line_at(insert_index)) if insert_index < len(sequence) else None)],
+                                                    seeds=[self.rng.randint(0, 1000000)] if self.perLineSeeds else None,
+                                                    rng=self.rng)[0]
+            camo_element = sequence.insert(insert_index, logLine)
+
+            record = InjectionRecord(new_injection_line, injection.attack_type, injection.payload, injection.count)
+            injectionAnchors.append((record, sequence.element(new_injection_line - 1) if before else -1))
+            camoAnchors.append((camo_element, payload, spaces))
 
             camo_added += 1
 
-        return SanitizeRecord(id=0 if before else 1, lines=lines, injectionRecords=injectionsList, camouflageRecords=camoList)
\ No newline at end of file
+        injectionsList = [InjectionRecord(sequence.position(anchor) + 1, record.attack_type, record.payload, record.count)
+                          if anchor != -1 else record
+                          for record, anchor in injectionAnchors]
+        camoList = [CamouflageRecord(sequence.position(element) + 1, payload, spacing=spaces)
+                    for element, payload, spaces in camoAnchors]
+
+        return SanitizeRecord(id=0 if before else 1, lines=sequence.overlay(), injectionRecords=injectionsList, camouflageRecords=camoList)
\ No newline at end of file
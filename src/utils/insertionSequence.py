@@ -0,0 +1,93 @@
+from src.utils.lineOverlay import LineOverlay
+
+
+class InsertionSequence:
+    def __init__(self, base: list[str]):
+        # Inserted lines live in gaps, gap g holds the lines in front of base[g] and gap len(base) the tail.
+        # A Fenwick tree over the gap weights (inserted lines + the base line behind them) turns
+        # position lookups and inserts into O(log n) instead of shifting a list.
+        self.base = base
+        self.size = len(base) + 1
+        self.tree = [0] * (self.size + 1)
+        for slot in range(1, self.size + 1):
+            self.tree[slot] += 1 if slot <= len(base) else 0
+            parent = slot + (slot & -slot)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[slot]
+
+        self.gaps: dict[int, list[int]] = {}
+        self.inserted: list[str] = []
+        self.gap_of: list[int] = []
+
+        self.step = 1
+        while self.step * 2 <= self.size:
+            self.step *= 2
+
+    def __len__(self) -> int:
+        return len(self.base) + len(self.inserted)
+
+    def prefix(self, gap: int) -> int:
+        # Number of elements in front of base[gap], i.e. in gaps 0..gap-1 plus their base lines.
+        total = 0
+        slot = gap
+        while slot > 0:
+            total += self.tree[slot]
+            slot -= slot & -slot
+        return total
+
+    def locate(self, position: int) -> tuple[int, int]:
+        if position == len(self):
+            return len(self.base), len(self.gaps.get(len(self.base), []))
+
+        slot = 0
+        remaining = position
+        step = self.step
+        while step:
+            next_slot = slot + step
+            if next_slot <= self.size and self.tree[next_slot] <= remaining:
+                slot = next_slot
+                remaining -= self.tree[next_slot]
+            step >>= 1
+        return slot, remaining
+
+    def element(self, position: int) -> int:
+        # Elements are base indices for package lines and len(base) + n for the n-th inserted line.
+        gap, rank = self.locate(position)
+        inserted = self.gaps.get(gap, [])
+        if rank < len(inserted):
+            return len(self.base) + inserted[rank]
+        return gap
+
+    def line(self, element: int) -> str:
+        if element < len(self.base):
+            return self.base[element]
+        return self.inserted[element - len(self.base)]
+
+    def line_at(self, position: int) -> str:
+        return self.line(self.element(position))
+
+    def insert(self, position: int, line: str) -> int:
+        gap, rank = self.locate(position)
+        inserted_id = len(self.inserted)
+        self.inserted.append(line)
+        self.gap_of.append(gap)
+        self.gaps.setdefault(gap, []).insert(rank, inserted_id)
+
+        slot = gap + 1
+        while slot <= self.size:
+            self.tree[slot] += 1
+            slot += slot & -slot
+        return len(self.base) + inserted_id
+
+    def position(self, element: int) -> int:
+        if element < len(self.base):
+            return self.prefix(element + 1) - 1
+        inserted_id = element - len(self.base)
+        gap = self.gap_of[inserted_id]
+        return self.prefix(gap) + self.gaps[gap].index(inserted_id)
+
+    def overlay(self) -> LineOverlay:
+        insertions = [(gap, self.inserted[inserted_id])
+                      for gap in sorted(self.gaps)
+                      for inserted_id in self.gaps[gap]]
+        return LineOverlay(self.base, insertions)
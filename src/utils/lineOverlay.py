@@ -0,0 +1,30 @@
+from typing import Iterator
+
+
+class LineOverlay:
+    def __init__(self, base: list[str], insertions: list[tuple[int, str]]):
+        # insertions are (index in base, line), sorted by index. A line is placed before base[index],
+        # lines with the same index keep their list order and index == len(base) appends at the end.
+        self.base = base
+        self.insertions = insertions
+
+    def __len__(self) -> int:
+        return len(self.base) + len(self.insertions)
+
+    def __iter__(self) -> Iterator[str]:
+        next_line = 0
+        for index, line in self.insertions:
+            yield from self.base[next_line:index]
+            yield line
+            next_line = index
+        yield from self.base[next_line:]
+
+    def materialize(self) -> list[str]:
+        output: list[str] = []
+        next_line = 0
+        for index, line in self.insertions:
+            output.extend(self.base[next_line:index])
+            output.append(line)
+            next_line = index
+        output.extend(self.base[next_line:])
+        return output
@@ -3,8 +3,6 @@ from random import Random
 from src.utils.models import LogRow
 import random
 import calendar
-import socket
-import struct
 import re
 from datetime import datetime, timedelta, timezone
 from typing import Optional
@@ -52,12 +50,35 @@ def parse_line(line: str) -> Optional[LogRow]:
 
 
 APACHE_TIME_FMT = "%d/%b/%Y:%H:%M:%S %z"
+APACHE_TIME_RE = re.compile(r'(\d{2})/([A-Za-z]{3})/(\d{4}):(\d{2}):(\d{2}):(\d{2}) ([+-])(\d{2})([0-5]\d)')
+MONTHS = {abbr: i for i, abbr in enumerate(calendar.month_abbr) if abbr}
+TIMEZONES: dict[str, timezone] = {}
+MONTH_NAMES = list(calendar.month_abbr)
+ZONE_TEXT: dict[timedelta | None, str] = {}
 
 
 def parse_apache_time(timestr: str) -> datetime:
     return datetime.strptime(timestr, APACHE_TIME_FMT)
 
 
+def fast_parse_apache_time(timestr: str) -> datetime:
+    m = APACHE_TIME_RE.fullmatch(timestr)
+    month = MONTHS.get(m.group(2)) if m else None
+    if month is None:
+        # Anything off the fixed format (other month spelling, ":" in the offset, ...) is left to strptime.
+        return parse_apache_time(timestr)
+
+    offset = timestr[-5:]
+    tz = TIMEZONES.get(offset)
+    if tz is None:
+        minutes = int(m.group(8)) * 60 + int(m.group(9))
+        tz = timezone(timedelta(minutes=-minutes if m.group(7) == "-" else minutes))
+        TIMEZONES[offset] = tz
+
+    return datetime(int(m.group(3)), month, int(m.group(1)),
+                    int(m.group(4)), int(m.group(5)), int(m.group(6)), tzinfo=tz)
+
+
 def format_apache_time(dt: datetime) -> str:
     return dt.strftime(APACHE_TIME_FMT)
 
@@ -69,11 +90,27 @@ def get_datetime_from_line(line: str) -> Optional[datetime]:
     if parsed is None:
         return None
     try:
-        return parse_apache_time(parsed.time)
+        return fast_parse_apache_time(parsed.time)
     except Exception:
         return None
 
 
+class TimestampIndex:
+    def __init__(self):
+        # Keyed by the line itself: str caches its hash, and inserted lines are picked up the first
+        # time they become a neighbour, so the index stays valid while lines are inserted.
+        self.times: dict[str, Optional[datetime]] = {}
+
+    def time_of(self, line: str | None) -> Optional[datetime]:
+        if not line:
+            return None
+        if line in self.times:
+            return self.times[line]
+        moment = get_datetime_from_line(line)
+        self.times[line] = moment
+        return moment
+
+
 def random_time_between(
         prev_dt: Optional[datetime],
         next_dt: Optional[datetime],
@@ -112,23 +149,48 @@ def random_apache_time(start: datetime | None = None,
     return moment
 
 
+def int_to_ip(value: int) -> str:
+    return f"{value >> 24}.{value >> 16 & 255}.{value >> 8 & 255}.{value & 255}"
+
+
+def format_log_time(moment: datetime) -> str:
+    # calendar.month_abbr runs strftime on every lookup, the names and offsets are resolved once instead.
+    offset = moment.utcoffset()
+    zone = ZONE_TEXT.get(offset)
+    if zone is None:
+        zone = ZONE_TEXT[offset] = f"{moment:%z}"
+    return (f"{moment.day:02d}/{MONTH_NAMES[moment.month]}/{moment.year}:"
+            f"{moment.hour:02d}:{moment.minute:02d}:{moment.second:02d} {zone}")
+
+
 def build_log_line_with_payload(payload: str,
                                 line_no: int | None = None,
                                 seed: int = random.randint(0, 1000000),
                                 time: str | None = None,
                                 line_before: str | None = None,
-                                line_after: str | None = None) -> LogRow:
-    rng = random.Random(seed)
+                                line_after: str | None = None,
+                                timestamps: TimestampIndex | None = None) -> LogRow:
+    if timestamps is not None:
+        prev_dt, next_dt = timestamps.time_of(line_before), timestamps.time_of(line_after)
+    else:
+        prev_dt, next_dt = get_datetime_from_line(line_before), get_datetime_from_line(line_after)
+
+    return draw_log_line(payload, random.Random(seed), prev_dt, next_dt, line_no, time)
 
-    moment = random_time_between(get_datetime_from_line(line_before),
-                                 get_datetime_from_line(line_after),
-                                 rng=rng, )
-    month = calendar.month_abbr[moment.month]
+
+def draw_log_line(payload: str,
+                  rng: Random,
+                  prev_dt: Optional[datetime],
+                  next_dt: Optional[datetime],
+                  line_no: int | None = None,
+                  time: str | None = None) -> LogRow:
+    # The draw order is part of the output, a line built from Random(seed) has to stay the same line.
+    moment = random_time_between(prev_dt, next_dt, rng=rng, )
 
     return LogRow(
         line_no=line_no,
-        ip=socket.inet_ntoa(struct.pack('>I', rng.randint(1, 0xffffffff))),
-        time=time or f"{moment.day:02d}/{month}/{moment.year}:{moment:%H:%M:%S} {moment:%z}",
+        ip=int_to_ip(rng.randint(1, 0xffffffff)),
+        time=time or format_log_time(moment),
         method=rng.choice(dictionary['request']),
         path=payload,
         protocol="HTTP/1.0",
@@ -137,3 +199,35 @@ def build_log_line_with_payload(payload: str,
         referer=rng.choice(dictionary['referrer']),
         ua=rng.choice(dictionary['ua'])
     )
+
+
+def build_log_lines_with_payloads(payloads: list[str],
+                                  neighbours: list[tuple[Optional[datetime], Optional[datetime]]],
+                                  seeds: list[int] | None = None,
+                                  rng: Random | None = None) -> list[str]:
+    # neighbours holds the (previous, next) timestamps every line is placed between.
+    # With seeds every line gets its own Random(seed) and matches build_log_line_with_payload exactly.
+    # Without, all columns are drawn from rng in one go, which skips seeding a generator per line.
+    if len(neighbours) != len(payloads):
+        raise ValueError(f"Got {len(neighbours)} neighbour timestamps for {len(payloads)} payloads")
+
+    if seeds is not None:
+        if len(seeds) != len(payloads):
+            raise ValueError(f"Got {len(seeds)} seeds for {len(payloads)} payloads")
+        return [str(draw_log_line(payload, random.Random(seed), prev_dt, next_dt))
+                for payload, (prev_dt, next_dt), seed in zip(payloads, neighbours, seeds)]
+
+    rng = rng or random.Random()
+    count = len(payloads)
+    moments = [random_time_between(prev_dt, next_dt, rng=rng) for prev_dt, next_dt in neighbours]
+    ips = [rng.getrandbits(32) or 1 for _ in range(count)]
+    methods = rng.choices(dictionary['request'], k=count)
+    statuses = rng.choices(dictionary['statuscode'], k=count)
+    sizes = [int(rng.gauss(5000, 50)) for _ in range(count)]
+    referrers = rng.choices(dictionary['referrer'], k=count)
+    uas = rng.choices(dictionary['ua'], k=count)
+
+    return [str(LogRow(None, int_to_ip(ip), format_log_time(moment), method, payload, "HTTP/1.0", status, str(size),
+                       referer, ua))
+            for payload, moment, ip, method, status, size, referer, ua
+            in zip(payloads, moments, ips, methods, statuses, sizes, referrers, uas)]
@@ -0,0 +1,286 @@
+import calendar
+from array import array
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from src.utils.logRowHelper import int_to_ip, LOG_RE, MONTH_NAMES, MONTHS
+from src.utils.models import LogRow
+
+INT64_MAX = 2 ** 63 - 1
+EPOCH = datetime(1970, 1, 1)
+
+
+class StringPool:
+    def __init__(self):
+        self.values: list[str] = []
+        self.ids: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def index(self, value: str) -> int:
+        index = self.ids.get(value)
+        if index is None:
+            index = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+
+def ip_to_int(ip: str) -> int | None:
+    # Only dotted quads that print back exactly, "010.0.0.1" or IPv6 stay text.
+    parts = ip.split(".")
+    if len(parts) != 4:
+        return None
+    value = 0
+    for part in parts:
+        if not (part.isascii() and part.isdigit()) or len(part) > 3 or (len(part) > 1 and part[0] == "0") or int(part) > 255:
+            return None
+        value = value << 8 | int(part)
+    return value
+
+
+def time_to_epoch(timestr: str) -> tuple[int, int] | None:
+    # "10/Oct/2000:13:55:36 -0700" to (UTC epoch seconds, offset minutes), None for anything that would not
+    # render back to the same text.
+    if len(timestr) != 26 or timestr[2] != "/" or timestr[6] != "/" or timestr[11] != ":" or timestr[20] != " ":
+        return None
+    month = MONTHS.get(timestr[3:6])
+    sign = timestr[21]
+    digits = timestr[0:2] + timestr[7:11] + timestr[12:14] + timestr[15:17] + timestr[18:20] + timestr[22:26]
+    if month is None or sign not in "+-" or not (digits.isascii() and digits.isdigit()) or timestr[14] != ":" or timestr[17] != ":":
+        return None
+    day, year = int(timestr[0:2]), int(timestr[7:11])
+    hour, minute, second = int(timestr[12:14]), int(timestr[15:17]), int(timestr[18:20])
+    offset = (int(timestr[22:24]) * 60 + int(timestr[24:26])) * (-1 if sign == "-" else 1)
+    # calendar and time only cover years 1 to 9999, "0000" matches LOG_RE all the same.
+    if not (1 <= year <= 9999 and 1 <= day <= calendar.monthrange(year, month)[1] and hour < 24 and minute < 60 and second < 60
+            and int(timestr[24:26]) < 60) or (offset == 0 and sign == "-"):
+        return None
+    return calendar.timegm((year, month, day, hour, minute, second)) - offset * 60, offset
+
+
+def local_time(epoch: int, offset: int) -> datetime:
+    # Naive local time, always within the years 1 to 9999 that time_to_epoch accepted. time.gmtime would
+    # fail on negative epochs on Windows and fromtimestamp on UTC instants in year 0.
+    return EPOCH + timedelta(seconds=epoch + offset * 60)
+
+
+def epoch_to_time(epoch: int, offset: int) -> str:
+    local = local_time(epoch, offset)
+    sign = "-" if offset < 0 else "+"
+    return (f"{local.day:02d}/{MONTH_NAMES[local.month]}/{local.year:04d}:"
+            f"{local.hour:02d}:{local.minute:02d}:{local.second:02d} {sign}{abs(offset) // 60:02d}{abs(offset) % 60:02d}")
+
+
+class LogTable:
+    def __init__(self):
+        # One column per field. Methods, protocols, referrers and user agents are ids into string pools,
+        # paths are slices of one string. Values the columns can't hold exactly (IPv6, odd time spellings,
+        # sizes like "0012", anything with non-ASCII digits) are kept as text in raw, the column then holds 0 / -1.
+        self.line_nos = array("I")
+        self.ips = array("I")
+        self.times = array("q")
+        self.offsets = array("h")
+        self.statuses = array("h")
+        self.sizes = array("q")
+        self.methods = array("I")
+        self.protocols = array("I")
+        self.referrers = array("I")
+        self.uas = array("I")
+        self.path_ends = array("Q")
+        self.path_parts: list[str] = []
+        self.path_text = ""
+        self.method_pool = StringPool()
+        self.protocol_pool = StringPool()
+        self.referrer_pool = StringPool()
+        self.ua_pool = StringPool()
+        self.raw: dict[tuple[int, str], str] = {}
+        self.lines_read = 0
+        self.skipped = 0
+
+    def __len__(self) -> int:
+        return len(self.ips)
+
+    @classmethod
+    def from_lines(cls, lines: Iterable[str]) -> "LogTable":
+        table = cls()
+        table.extend(lines)
+        return table
+
+    @classmethod
+    def from_file(cls, path: Path) -> "LogTable":
+        with path.open(encoding="utf-8") as f:
+            return cls.from_lines(ln.rstrip("\n") for ln in f)
+
+    def extend(self, lines: Iterable[str]) -> None:
+        # Same regex and field split as parse_line, lines it would reject are counted in skipped.
+        # Repeated IPs and timestamps are converted once per batch.
+        ip_cache: dict[str, int | None] = {}
+        time_cache: dict[str, tuple[int, int] | None] = {}
+        method_index = self.method_pool.index
+        protocol_index = self.protocol_pool.index
+        referrer_index = self.referrer_pool.index
+        ua_index = self.ua_pool.index
+        path_end = self.path_ends[-1] if self.path_ends else 0
+        line_no = self.lines_read
+        match = LOG_RE.match
+        raw = self.raw
+        row = len(self.ips)
+        add_line_no, add_ip, add_time, add_offset = (self.line_nos.append, self.ips.append, self.times.append,
+                                                     self.offsets.append)
+        add_status, add_size, add_method, add_protocol = (self.statuses.append, self.sizes.append,
+                                                          self.methods.append, self.protocols.append)
+        add_referrer, add_ua, add_path_end, add_path = (self.referrers.append, self.uas.append,
+                                                        self.path_ends.append, self.path_parts.append)
+
+        for line in lines:
+            line_no += 1
+            m = match(line)
+            if m is None:
+                self.skipped += 1
+                continue
+            ip, _, _, timestr, request, status, size, referer, ua, _ = m.groups()
+
+            ip_value = ip_cache.get(ip, -1)
+            if ip_value == -1:
+                ip_value = ip_cache[ip] = ip_to_int(ip)
+            if ip_value is None:
+                raw[(row, "ip")] = ip
+                ip_value = 0
+
+            moment = time_cache.get(timestr, -1)
+            if moment == -1:
+                moment = time_cache[timestr] = time_to_epoch(timestr)
+            if moment is None:
+                raw[(row, "time")] = timestr
+                moment = (0, 0)
+
+            # isdigit() also takes other scripts' digits, which int() would print back as ASCII.
+            if size.isascii() and size.isdigit() and (size == "0" or size[0] != "0") and int(size) <= INT64_MAX:
+                size_value = int(size)
+            else:
+                size_value = -1
+                if size != "-":
+                    raw[(row, "size")] = size
+
+            method, path, protocol = ((request or "").split() + ["", "", ""])[:3]
+            path_end += len(path)
+            add_path(path)
+
+            add_line_no(line_no)
+            add_ip(ip_value)
+            add_time(moment[0])
+            add_offset(moment[1])
+            if status.isascii():
+                add_status(int(status))
+            else:
+                raw[(row, "status")] = status
+                add_status(0)
+            add_size(size_value)
+            add_method(method_index(method))
+            add_protocol(protocol_index(protocol))
+            add_referrer(referrer_index(referer))
+            add_ua(ua_index(ua))
+            add_path_end(path_end)
+            row += 1
+
+        self.lines_read = line_no
+        if self.path_parts:
+            self.path_text += "".join(self.path_parts)
+            self.path_parts = []
+
+    def ip(self, row: int) -> str:
+        return self.raw.get((row, "ip")) or int_to_ip(self.ips[row])
+
+    def time(self, row: int) -> str:
+        return self.raw.get((row, "time")) or epoch_to_time(self.times[row], self.offsets[row])
+
+    def datetime(self, row: int) -> datetime | None:
+        if (row, "time") in self.raw:
+            return None
+        offset = self.offsets[row]
+        return local_time(self.times[row], offset).replace(tzinfo=timezone(timedelta(minutes=offset)))
+
+    def path(self, row: int) -> str:
+        start = self.path_ends[row - 1] if row > 0 else 0
+        return self.path_text[start:self.path_ends[row]]
+
+    def status(self, row: int) -> str:
+        return self.raw.get((row, "status")) or f"{self.statuses[row]:03d}"
+
+    def size(self, row: int) -> str:
+        raw = self.raw.get((row, "size"))
+        if raw is not None:
+            return raw
+        return "-" if self.sizes[row] == -1 else str(self.sizes[row])
+
+    def row(self, row: int) -> "LogTableRow":
+        if not -len(self) <= row < len(self):
+            raise IndexError(f"Row {row} out of range for {len(self)} rows")
+        return LogTableRow(self, row % len(self))
+
+    def __getitem__(self, row: int) -> "LogTableRow":
+        return self.row(row)
+
+    def __iter__(self) -> Iterator["LogTableRow"]:
+        return (LogTableRow(self, row) for row in range(len(self)))
+
+    def nbytes(self) -> int:
+        columns = (self.line_nos, self.ips, self.times, self.offsets, self.statuses, self.sizes, self.methods,
+                   self.protocols, self.referrers, self.uas, self.path_ends)
+        return sum(column.itemsize * len(column) for column in columns) + len(self.path_text)
+
+
+@dataclass(frozen=True)
+class LogTableRow:
+    table: LogTable
+    index: int
+
+    @property
+    def line_no(self) -> int:
+        return self.table.line_nos[self.index]
+
+    @property
+    def ip(self) -> str:
+        return self.table.ip(self.index)
+
+    @property
+    def time(self) -> str:
+        return self.table.time(self.index)
+
+    @property
+    def method(self) -> str:
+        return self.table.method_pool.values[self.table.methods[self.index]]
+
+    @property
+    def path(self) -> str:
+        return self.table.path(self.index)
+
+    @property
+    def protocol(self) -> str:
+        return self.table.protocol_pool.values[self.table.protocols[self.index]]
+
+    @property
+    def status(self) -> str:
+        return self.table.status(self.index)
+
+    @property
+    def size(self) -> str:
+        return self.table.size(self.index)
+
+    @property
+    def referer(self) -> str:
+        return self.table.referrer_pool.values[self.table.referrers[self.index]]
+
+    @property
+    def ua(self) -> str:
+        return self.table.ua_pool.values[self.table.uas[self.index]]
+
+    def to_log_row(self) -> LogRow:
+        return LogRow(self.line_no, self.ip, self.time, self.method, self.path, self.protocol, self.status,
+                      self.size, self.referer, self.ua)
+
+    def __str__(self) -> str:
+        return str(self.to_log_row())
@@ -4,13 +4,14 @@ from pathlib import Path
 from typing import Literal
 
 from src.utils.fileHelper import read_lines
+from src.utils.lineOverlay import LineOverlay
 
 AttackType = Literal["SQLi", "XSS", "CmdInject", "DoS/DDoS", "UNKNOWN", "Sanitize"]
 
 @dataclass(frozen=True)
 class SanitizeRecord:
     id: int
-    lines: list[str]
+    lines: LineOverlay
     injectionRecords: list[InjectionRecord]
     camouflageRecords: list[CamouflageRecord]
 
@@ -92,6 +93,14 @@ class ComparisonResult:
         return 2 * (p * r) / (p + r)
 
 
+@dataclass(frozen=True)
+class GroupedAnswers:
+    by_type: dict[str, dict[int, LLMAnswer]]
+    line_counts: dict[int | None, int]
+    total: int
+    time_needed: float
+
+
 class AttackPayloads:
     def __init__(self, attacks_dir: Path):
         def load(name: str) -> list[str]:
@@ -0,0 +1,57 @@
+import contextvars
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+DONE = object()
+
+
+def background_map(function: Callable[[T], R], iterable: Iterable[T], queueSize: int, name: str = "stage") -> Iterator[R]:
+    # Runs function over iterable in its own thread and yields the results in order.
+    # The queue is bounded, so the thread runs at most queueSize items ahead of the consumer.
+    results: queue.Queue = queue.Queue(maxsize=queueSize)
+    stop = threading.Event()
+
+    def put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                results.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put((function(item), None)):
+                    return
+        except BaseException as e:
+            put((None, e))
+            return
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+        put(DONE)
+
+    # The thread runs in a copy of the consumer's context, timing spans opened there keep their parent.
+    context = contextvars.copy_context()
+    thread = threading.Thread(target=context.run, args=(produce,), name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            entry = results.get()
+            if entry is DONE:
+                return
+            result, error = entry
+            if error is not None:
+                raise error
+            yield result
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,246 @@
+import argparse
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from src.utils.logRowHelper import LOG_RE, APACHE_TIME_FMT, fast_parse_apache_time
+from src.utils.tokenEstimator import estimate_tokens
+
+ENCODINGS = ("plain", "compact")
+FIELDS = ["ip", "ident", "user", "time", "request", "status", "size", "referer", "ua"]
+UNQUOTED = ["ip", "ident", "user", "status", "size"]
+LEGEND_PREFIXES = {"referer": "R", "ua": "U"}
+
+COMPACT_HEADER = "COMPACT LOG"
+NUMBERED_RE = re.compile(r'^\[LINE (?P<line_no>\d+)] (?P<line>.*)$')
+
+
+def render_fields(fields: dict[str, str]) -> str:
+    return (f'{fields["ip"]} {fields["ident"]} {fields["user"]} [{fields["time"]}] "{fields["request"]}" '
+            f'{fields["status"]} {fields["size"]} "{fields["referer"]}" "{fields["ua"]}"')
+
+
+def parse_fields(line: str) -> dict[str, str] | None:
+    # Only lines that render back to exactly themselves are encoded, everything else is sent as RAW.
+    m = LOG_RE.match(line)
+    if not m:
+        return None
+    fields = m.groupdict()
+    if render_fields(fields) != line or any(fields[field][:1] in ('"', '[') for field in UNQUOTED):
+        return None
+    return fields
+
+
+def parse_time(timestr: str) -> datetime | None:
+    try:
+        return fast_parse_apache_time(timestr)
+    except ValueError:
+        return None
+
+
+def time_delta(base: datetime, timestr: str) -> int | None:
+    t = parse_time(timestr)
+    if t is None or t.utcoffset() != base.utcoffset():
+        return None
+    delta = round((t - base).total_seconds())
+    if (base + timedelta(seconds=delta)).strftime(APACHE_TIME_FMT) != timestr:
+        return None
+    return delta
+
+
+def encode_plain(lines: list[str]) -> str:
+    return '\n'.join(f"[LINE {i+1}] {line}" for i, line in enumerate(lines))
+
+
+def encode_compact(lines: list[str]) -> str:
+    # Header first: fields that are the same on every line, a legend for repeated referrers and user agents
+    # and a base time. Lines then carry only what differs, the [LINE n] numbering is untouched.
+    parsed = [parse_fields(line) for line in lines]
+    rows = [fields for fields in parsed if fields is not None]
+
+    same: dict[str, str] = {}
+    if len(rows) >= 2:
+        for field in FIELDS:
+            if field != "time" and all(row[field] == rows[0][field] for row in rows):
+                same[field] = rows[0][field]
+
+    # The protocol is the tail of the request, it is only cut off when every request ends with the same one.
+    protocol = ""
+    if len(rows) >= 2 and "request" not in same and " " in rows[0]["request"]:
+        protocol = rows[0]["request"].rsplit(" ", 1)[1]
+        if not all(row["request"].endswith(f" {protocol}") for row in rows):
+            protocol = ""
+
+    legend: dict[str, dict[str, str]] = {field: {} for field in LEGEND_PREFIXES if field not in same}
+    counts: dict[tuple[str, str], int] = {}
+    for row in rows:
+        for field in legend:
+            counts[(field, row[field])] = counts.get((field, row[field]), 0) + 1
+    for (field, value), count in counts.items():
+        if count >= 2 and len(value) > 3:
+            legend[field][value] = f"{LEGEND_PREFIXES[field]}{len(legend[field]) + 1}"
+
+    base = None
+    base_str = ""
+    for row in rows:
+        base = parse_time(row["time"])
+        if base is not None:
+            base_str = row["time"]
+            break
+
+    fields = [field for field in FIELDS if field not in same]
+    header = [f"{COMPACT_HEADER}: every [LINE n] lists {' '.join(fields)}. Lines marked RAW are given unchanged."]
+    if base is not None:
+        header.append(f"TIME +s / -s are seconds relative to [{base_str}], other times are given in full")
+    header += [f"SAME {field}={value}" for field, value in same.items()]
+    if protocol:
+        header.append(f"SAME protocol={protocol} (left out at the end of every request)")
+    header += [f'LEGEND {ref}="{value}"' for field in legend for value, ref in legend[field].items()]
+
+    output = header
+    for i, (line, row) in enumerate(zip(lines, parsed)):
+        if row is None:
+            output.append(f"[LINE {i+1}] RAW {line}")
+            continue
+
+        tokens = []
+        for field in fields:
+            value = row[field]
+            if field == "time":
+                delta = time_delta(base, value) if base is not None else None
+                tokens.append(f"[{value}]" if delta is None else f"{delta:+d}")
+            elif field in legend and value in legend[field]:
+                tokens.append(legend[field][value])
+            elif field in UNQUOTED:
+                tokens.append(value)
+            elif field == "request" and protocol:
+                tokens.append(f'"{value[:-len(protocol) - 1]}"')
+            else:
+                tokens.append(f'"{value}"')
+        output.append(f"[LINE {i+1}] {' '.join(tokens)}")
+
+    return '\n'.join(output)
+
+
+def split_tokens(text: str) -> list[str]:
+    tokens = []
+    i = 0
+    while i < len(text):
+        if text[i] in '"[':
+            end = text.index('"' if text[i] == '"' else ']', i + 1) + 1
+        else:
+            end = text.find(' ', i)
+            end = len(text) if end == -1 else end
+        tokens.append(text[i:end])
+        i = end + 1
+    return tokens
+
+
+def decode_numbered(text: str) -> list[tuple[int, str]]:
+    # Inverse of both encodings, gives (line number, original line) for every numbered line.
+    lines = text.split('\n')
+    if not lines[0].startswith(COMPACT_HEADER):
+        return [(int(m.group("line_no")), m.group("line")) for m in map(NUMBERED_RE.match, lines) if m]
+
+    same: dict[str, str] = {}
+    legend: dict[str, str] = {}
+    protocol = ""
+    base = None
+    decoded = []
+    for line in lines:
+        m = NUMBERED_RE.match(line)
+        if m is None:
+            if line.startswith("TIME "):
+                base = fast_parse_apache_time(line[line.index("[") + 1:line.index("]")])
+            elif line.startswith("SAME protocol="):
+                protocol = line[14:].split(" ", 1)[0]
+            elif line.startswith("SAME "):
+                field, _, value = line[5:].partition("=")
+                same[field] = value
+            elif line.startswith("LEGEND "):
+                ref, _, value = line[7:].partition("=")
+                legend[ref] = value[1:-1]
+            continue
+
+        rest = m.group("line")
+        if rest.startswith("RAW "):
+            decoded.append((int(m.group("line_no")), rest[4:]))
+            continue
+
+        fields = dict(same)
+        for field, token in zip([field for field in FIELDS if field not in same], split_tokens(rest)):
+            if field == "request" and protocol:
+                fields[field] = f"{token[1:-1]} {protocol}"
+            elif token[:1] in '"[':
+                fields[field] = token[1:-1]
+            elif field == "time":
+                fields[field] = (base + timedelta(seconds=int(token))).strftime(APACHE_TIME_FMT)
+            elif field in LEGEND_PREFIXES and token in legend:
+                fields[field] = legend[token]
+            else:
+                fields[field] = token
+        decoded.append((int(m.group("line_no")), render_fields(fields)))
+    return decoded
+
+
+class EncodingStats:
+    def __init__(self):
+        self.requests = 0
+        self.plain_tokens = 0
+        self.encoded_tokens = 0
+        self.lock = threading.Lock()
+
+    def add(self, plainTokens: int, encodedTokens: int) -> None:
+        with self.lock:
+            self.requests += 1
+            self.plain_tokens += plainTokens
+            self.encoded_tokens += encodedTokens
+
+    def __str__(self) -> str:
+        saved = 1 - self.encoded_tokens / self.plain_tokens if self.plain_tokens else 0.0
+        return f"requests={self.requests} plain_tokens={self.plain_tokens} encoded_tokens={self.encoded_tokens} saved={saved:.1%}"
+
+
+encoding_stats = EncodingStats()
+
+
+def encode_numbered(lines: list[str], encoding: str | None = None) -> str:
+    encoding = encoding or os.getenv("PROMPT_ENCODING", "plain").lower()
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Invalid PROMPT_ENCODING: {encoding}")
+
+    plain = encode_plain(lines)
+    if encoding == "plain":
+        return plain
+
+    # The header costs tokens as well, tiny or very diverse packets stay plain.
+    compact = encode_compact(lines)
+    encoded = compact if len(compact) < len(plain) else plain
+    encoding_stats.add(estimate_tokens(plain), estimate_tokens(encoded))
+    return encoded
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compares the estimated prompt tokens of the plain and the compact encoding.")
+    parser.add_argument("logs", type=Path, nargs="+")
+    parser.add_argument("--packet-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    for path in args.logs:
+        lines = path.read_text(encoding="utf-8").split('\n')
+        if lines and lines[-1] == "":
+            lines.pop()
+        stats = EncodingStats()
+        for i in range(0, len(lines), args.packet_size):
+            packet = lines[i:i + args.packet_size]
+            compact = encode_compact(packet)
+            if decode_numbered(compact) != list(enumerate(packet, 1)):
+                raise ValueError(f"{path}: compact encoding of lines {i + 1}-{i + len(packet)} does not round trip")
+            stats.add(estimate_tokens(encode_plain(packet)), estimate_tokens(compact))
+        print(f"{path}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import sqlite3
+from pathlib import Path
+
+# Detail rows are (kind, line_no, attack_type, text, confidence) with kind TP, FN, FP or ANSWER.
+# line_no, text, confidence and time_needed are left untyped, SQLite then keeps ints, floats and None as they came.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    package_dir TEXT,
+    package INTEGER
+);
+CREATE TABLE IF NOT EXISTS comparisons (
+    id INTEGER PRIMARY KEY,
+    package_dir TEXT,
+    package INTEGER,
+    variant TEXT,
+    extra TEXT,
+    attack_type TEXT,
+    model TEXT,
+    true_positives INTEGER,
+    false_negatives INTEGER,
+    false_positives INTEGER,
+    time_needed,
+    answers_total INTEGER
+);
+CREATE TABLE IF NOT EXISTS details (
+    comparison_id INTEGER,
+    kind TEXT,
+    line_no,
+    attack_type TEXT,
+    text,
+    confidence
+);
+"""
+
+
+class ResultBatch:
+    def __init__(self):
+        self.packages: list[tuple[str, int]] = []
+        self.comparisons: list[tuple] = []
+        # Detail rows reference their comparison by its index in this batch.
+        self.details: list[tuple] = []
+
+    def __len__(self) -> int:
+        return len(self.comparisons) + len(self.details)
+
+    def add_package(self, packageDir: str, package: int) -> None:
+        self.packages.append((packageDir, package))
+
+    def add_comparison(self,
+                       packageDir: str,
+                       package: int,
+                       variant: str,
+                       extra: str,
+                       attackType: str,
+                       model: str,
+                       truePositives: int,
+                       falseNegatives: int,
+                       falsePositives: int,
+                       timeNeeded: float,
+                       answersTotal: int,
+                       details: list[tuple]) -> None:
+        index = len(self.comparisons)
+        self.comparisons.append((packageDir, package, variant, extra, attackType, model,
+                                 truePositives, falseNegatives, falsePositives, timeNeeded, answersTotal))
+        self.details.extend((index, *detail) for detail in details)
+
+    def extend(self, other: "ResultBatch") -> None:
+        offset = len(self.comparisons)
+        self.packages.extend(other.packages)
+        self.comparisons.extend(other.comparisons)
+        self.details.extend((index + offset, *detail) for index, *detail in other.details)
+
+
+class ResultStore:
+    def __init__(self, path: Path, fresh: bool = False):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if fresh:
+            self.path.unlink(missing_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(SCHEMA)
+        self.next_id = (self.connection.execute("SELECT MAX(id) FROM comparisons").fetchone()[0] or 0) + 1
+        self.rows = 0
+
+    def write(self, batch: ResultBatch) -> None:
+        # One transaction and one executemany per table, ids are handed out here so details need no lookup.
+        first_id = self.next_id
+        with self.connection:
+            self.connection.executemany("INSERT INTO packages VALUES (?, ?)", batch.packages)
+            self.connection.executemany("INSERT INTO comparisons VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                        [(first_id + index, *row) for index, row in enumerate(batch.comparisons)])
+            self.connection.executemany("INSERT INTO details VALUES (?, ?, ?, ?, ?, ?)",
+                                        [(first_id + index, *detail) for index, *detail in batch.details])
+        self.next_id += len(batch.comparisons)
+        self.rows += len(batch)
+
+    def packages(self) -> list[tuple[str, int]]:
+        return self.connection.execute("SELECT package_dir, package FROM packages ORDER BY rowid").fetchall()
+
+    def comparisons(self) -> list[tuple]:
+        return self.connection.execute("SELECT * FROM comparisons ORDER BY id").fetchall()
+
+    def details(self) -> dict[int, list[tuple]]:
+        details: dict[int, list[tuple]] = {}
+        for comparison_id, *detail in self.connection.execute("SELECT * FROM details ORDER BY rowid"):
+            details.setdefault(comparison_id, []).append(tuple(detail))
+        return details
+
+    def close(self) -> None:
+        with self.connection:
+            self.connection.execute("CREATE INDEX IF NOT EXISTS details_comparison ON details(comparison_id)")
+        self.connection.close()
+
+    def __str__(self) -> str:
+        return f"rows={self.rows} path={self.path}"
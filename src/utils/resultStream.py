@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from src.utils.models import LLMAnswer
+from src.utils.timing import annotate
+from src.utils.tokenEstimator import estimate_tokens
+
+
+class ResultStreamParser:
+    def __init__(self):
+        # Picks the objects of a top level "results" array out of JSON text that arrives in pieces. Only the
+        # text of the object or key that is still open is kept, everything before it is dropped.
+        self.buffer = ""
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.key_start: int | None = None
+        self.last_key: str | None = None
+        self.results_depth: int | None = None
+        self.object_start: int | None = None
+        self.seen_results = False
+
+    def feed(self, fragment: str) -> list[dict]:
+        start = len(self.buffer)
+        self.buffer += fragment
+        results: list[dict] = []
+        for i in range(start, len(self.buffer)):
+            c = self.buffer[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif c == "\\":
+                    self.escaped = True
+                elif c == '"':
+                    self.in_string = False
+                    if self.key_start is not None:
+                        self.last_key = json.loads(self.buffer[self.key_start:i + 1])
+                        self.key_start = None
+            elif c == '"':
+                self.in_string = True
+                if self.depth == 1:
+                    self.key_start = i
+            elif c == "{" or c == "[":
+                if c == "[" and self.depth == 1 and self.last_key == "results":
+                    self.results_depth = 2
+                    self.seen_results = True
+                elif c == "{" and self.depth == self.results_depth:
+                    self.object_start = i
+                self.depth += 1
+            elif c == "}" or c == "]":
+                self.depth -= 1
+                if c == "}" and self.depth == self.results_depth and self.object_start is not None:
+                    results.append(json.loads(self.buffer[self.object_start:i + 1]))
+                    self.object_start = None
+                elif c == "]" and self.depth == 1:
+                    self.results_depth = None
+
+        if self.object_start is None and self.key_start is None:
+            self.buffer = ""
+        return results
+
+
+@dataclass(frozen=True)
+class StreamMetrics:
+    time_to_first_token: float | None
+    time_to_first_result: float | None
+    total: float
+    output_tokens: int
+
+    def tokens_per_second(self) -> float:
+        # Generation speed after the first token, the wait for the first token is its own metric.
+        generating = self.total - (self.time_to_first_token or 0.0)
+        return self.output_tokens / generating if generating > 0 else 0.0
+
+
+class StreamStats:
+    def __init__(self):
+        self.metrics: dict[str, list[StreamMetrics]] = {}
+        self.lock = threading.Lock()
+
+    def add(self, model: str, metrics: StreamMetrics) -> None:
+        with self.lock:
+            self.metrics.setdefault(model, []).append(metrics)
+
+    def __str__(self) -> str:
+        def mean(values: list[float]) -> float:
+            return sum(values) / len(values) if values else 0.0
+
+        lines = []
+        for model, metrics in self.metrics.items():
+            ttft = mean([m.time_to_first_token for m in metrics if m.time_to_first_token is not None])
+            ttfr = mean([m.time_to_first_result for m in metrics if m.time_to_first_result is not None])
+            tps = mean([m.tokens_per_second() for m in metrics])
+            lines.append(f"{model}: requests={len(metrics)} ttft={ttft:.3f}s ttfr={ttfr:.3f}s tokens/s={tps:.1f}")
+        return "\n".join(lines)
+
+
+stream_stats = StreamStats()
+
+
+class ResultStream:
+    def __init__(self, model: str, toAnswer: Callable[[int, dict], LLMAnswer]):
+        self.model = model
+        self.toAnswer = toAnswer
+        self.parser = ResultStreamParser()
+        self.fragments: list[str] = []
+        self.answers: list[LLMAnswer] = []
+        self.output_tokens: int | None = None
+        self.first_token: float | None = None
+        self.first_result: float | None = None
+        self.t0 = time.perf_counter()
+
+    def mark_token(self) -> None:
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self.t0
+
+    def feed(self, fragment: str | None) -> None:
+        if not fragment:
+            return
+        self.mark_token()
+        self.fragments.append(fragment)
+        results = self.parser.feed(fragment)
+        if results and self.first_result is None:
+            self.first_result = time.perf_counter() - self.t0
+        for result in results:
+            self.answers.append(self.toAnswer(len(self.answers), result))
+
+    def finish(self) -> list[LLMAnswer]:
+        total = time.perf_counter() - self.t0
+        text = "".join(self.fragments)
+        if not self.parser.seen_results and text.strip():
+            # The arguments had no "results" array where the parser looks for it, parse them like a whole response.
+            self.answers = [self.toAnswer(i, result) for i, result in enumerate(json.loads(text).get("results", []))]
+
+        metrics = StreamMetrics(self.first_token,
+                                self.first_result,
+                                total,
+                                self.output_tokens if self.output_tokens is not None else estimate_tokens(text))
+        stream_stats.add(self.model, metrics)
+        annotate(time_to_first_token=metrics.time_to_first_token,
+                 time_to_first_result=metrics.time_to_first_result,
+                 output_tokens=metrics.output_tokens,
+                 tokens_per_second=metrics.tokens_per_second())
+        return self.answers
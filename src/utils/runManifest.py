@@ -0,0 +1,116 @@
+import hashlib
+import json
+import threading
+from dataclasses import asdict
+from pathlib import Path
+
+from src.utils.models import LLMAnswer
+
+
+class RunManifest:
+    def __init__(self, path: Path, fresh: bool = False, write: bool = True):
+        # Append only, one line per finished request, so a crash loses at most the requests in flight.
+        # Pool workers open it with write=False and hand their lines to the parent, the only process writing.
+        self.path = path
+        self.write = write
+        self.entries: dict[tuple[str, int, str, str], dict[str, tuple[list[LLMAnswer], float]]] = {}
+        self.pending: list[str] = []
+        self.resumed = 0
+        self.recorded = 0
+        self.lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if fresh:
+            self.path.unlink(missing_ok=True)
+        self.load()
+
+    @staticmethod
+    def hash_log(logPath: Path) -> str:
+        return hashlib.sha256(logPath.read_bytes()).hexdigest()
+
+    def load(self) -> None:
+        if not self.path.exists():
+            return
+
+        text = self.path.read_text(encoding="utf-8")
+        torn = False
+        for line in text.splitlines():
+            try:
+                entry = json.loads(line)
+                answers = [LLMAnswer(**answer) for answer in entry["answers"]]
+                key = (entry["file"], entry["package"], entry["variant"], entry["log_hash"])
+            except (json.JSONDecodeError, KeyError, TypeError):
+                torn = True
+                continue
+            torn = False
+            self.entries.setdefault(key, {})[entry["model"]] = (answers, entry["time_needed"])
+
+        if text and not text.endswith("\n") and self.write:
+            # A run killed while writing leaves a torn last line, it is cut off before new lines are appended.
+            with self.path.open("r+b") as f:
+                if torn:
+                    f.truncate(len(text[:text.rfind("\n") + 1].encode("utf-8")))
+                else:
+                    f.seek(0, 2)
+                    f.write(b"\n")
+
+    def done(self,
+             fileStem: str,
+             package: int,
+             variant: str,
+             logHash: str,
+             count: bool = True) -> dict[str, tuple[list[LLMAnswer], float]]:
+        # The log hash ties the answers to the exact file that was sent, other settings never resume stale answers.
+        with self.lock:
+            done = dict(self.entries.get((fileStem, package, variant, logHash), {}))
+            if count:
+                self.resumed += len(done)
+        return done
+
+    def put(self,
+            fileStem: str,
+            package: int,
+            variant: str,
+            model: str,
+            logHash: str,
+            result: tuple[list[LLMAnswer], float]) -> None:
+        answers, time_needed = result
+        line = json.dumps({
+            "file": fileStem,
+            "package": package,
+            "variant": variant,
+            "model": model,
+            "log_hash": logHash,
+            "answers": [asdict(answer) for answer in answers],
+            "time_needed": time_needed,
+        })
+        with self.lock:
+            if self.write:
+                self.append([line])
+            else:
+                self.pending.append(line)
+            self.entries.setdefault((fileStem, package, variant, logHash), {})[model] = result
+            self.recorded += 1
+
+    def append(self, lines: list[str]) -> None:
+        # Every line goes out in a single write, so a crash can only tear the last one.
+        with self.path.open("ab") as f:
+            for line in lines:
+                f.write((line + "\n").encode("utf-8"))
+
+    def take(self) -> tuple[list[str], int]:
+        # Lines and resume count a worker collected since the last call, for merge() in the parent.
+        with self.lock:
+            lines, resumed = self.pending, self.resumed
+            self.pending = []
+            self.resumed = 0
+        return lines, resumed
+
+    def merge(self, lines: list[str], resumed: int) -> None:
+        with self.lock:
+            self.append(lines)
+            self.recorded += len(lines)
+            self.resumed += resumed
+
+    def __str__(self) -> str:
+        return f"resumed={self.resumed} recorded={self.recorded} path={self.path}"
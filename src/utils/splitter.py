@@ -1,20 +1,78 @@
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from src.utils.tokenEstimator import CHARS_PER_TOKEN
+
+
 class Splitter:
-    def __init__(self, limit: int, packetSize: int):
+    def __init__(self, limit: int, packetSize: int, tokenBudget: int = -1, overheadTokens: int = 0):
         if packetSize <= 0:
             raise ValueError("packetSize must be greater than 0")
         self.packetSize = packetSize
         if limit < -1:
             raise ValueError("limit must be -1 or greater")
         self.limit = limit
+        # With a token budget packets are filled up to the budget and packetSize only caps their line count.
+        if tokenBudget != -1 and tokenBudget <= overheadTokens:
+            raise ValueError("tokenBudget must be -1 or greater than overheadTokens")
+        self.tokenBudget = tokenBudget
+        self.overheadTokens = overheadTokens
 
     def split(self, lines: list[str]) -> list[list[str]]:
         if lines is None:
             raise ValueError("lines is None")
 
+        if self.tokenBudget != -1:
+            return list(islice(self.pack_by_tokens(lines), self.limit if self.limit != -1 else None))
+
         outputList: list[list[str]] = []
         max_end = (len(lines) // self.packetSize) * self.packetSize
         for i in range(0, max_end, self.packetSize):
             if len(outputList) >= self.limit != -1:
                 break
             outputList.append(lines[i:i + self.packetSize])
-        return outputList
\ No newline at end of file
+        return outputList
+
+    def split_file(self, path: Path) -> Iterator[list[str]]:
+        # Streams the file and only ever holds the current packet, yields the same packets as split(read_lines(path)).
+        if self.limit == 0:
+            return
+
+        with path.open(encoding="utf-8") as f:
+            lines = (ln.rstrip("\n") for ln in f)
+            packets = self.pack_by_tokens(lines) if self.tokenBudget != -1 else self.pack_by_count(lines)
+            for count, packet in enumerate(packets, 1):
+                yield packet
+                if count >= self.limit != -1:
+                    return
+
+    def pack_by_count(self, lines: Iterable[str]) -> Iterator[list[str]]:
+        # Only full packets, a trailing rest is dropped.
+        packet: list[str] = []
+        for line in lines:
+            packet.append(line)
+            if len(packet) == self.packetSize:
+                yield packet
+                packet = []
+
+    def pack_by_tokens(self, lines: Iterable[str]) -> Iterator[list[str]]:
+        # Measured like the connectors send it, "[LINE n] " in front of every line and joined by newlines,
+        # so estimate_tokens of the numbered packet plus the static prompt stays within the budget.
+        # A single line above the budget still becomes its own packet, log lines are never cut.
+        budget_chars = (self.tokenBudget - self.overheadTokens) * CHARS_PER_TOKEN
+        packet: list[str] = []
+        chars = 0
+        for line in lines:
+            line_chars = len(f"[LINE {len(packet) + 1}] ") + len(line) + (1 if packet else 0)
+            if packet and (chars + line_chars > budget_chars or len(packet) == self.packetSize):
+                yield packet
+                packet = []
+                chars = 0
+                line_chars = len("[LINE 1] ") + len(line)
+            packet.append(line)
+            chars += line_chars
+
+        # Unlike fixed size packets the last one is kept, token packets differ in length anyway.
+        if packet:
+            yield packet
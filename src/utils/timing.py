@@ -0,0 +1,153 @@
+import csv
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class Span:
+    id: int
+    parent: int | None
+    name: str
+    start: float
+    duration: float = 0.0
+    attributes: dict[str, str | int] = field(default_factory=dict)
+
+
+# The timer and the span that is open in the current thread or task. Spans opened below it become its children,
+# connectors only call span() and stay unaware of the timer.
+current_timer: ContextVar["StageTimer | None"] = ContextVar("current_timer", default=None)
+current_span: ContextVar[int | None] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    timer = current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name, **attributes):
+        yield
+
+
+def annotate(**attributes) -> None:
+    # Adds attributes that are only known at the end, e.g. latency metrics, to the open span.
+    timer = current_timer.get()
+    span_id = current_span.get()
+    if timer is None or span_id is None:
+        return
+    with timer.lock:
+        timer.spans[span_id].attributes.update(attributes)
+
+
+class StageTimer:
+    def __init__(self):
+        self.totals: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+        self.spans: list[Span] = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def active(self):
+        # A forked worker inherits the open span of its parent, its own spans have to start as roots.
+        timer_token = current_timer.set(self)
+        span_token = current_span.set(None)
+        try:
+            yield self
+        finally:
+            current_span.reset(span_token)
+            current_timer.reset(timer_token)
+
+    @contextmanager
+    def stage(self, name: str, **attributes):
+        t0 = time.perf_counter()
+        with self.lock:
+            record = Span(len(self.spans), current_span.get(), name, t0, attributes=attributes)
+            self.spans.append(record)
+        token = current_span.set(record.id)
+        try:
+            yield
+        finally:
+            current_span.reset(token)
+            record.duration = time.perf_counter() - t0
+            self.add(name, record.duration)
+
+    def iterate(self, name: str, iterable: Iterable[T], **attributes) -> Iterator[T]:
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name, **attributes):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def add(self, name: str, seconds: float, count: int = 1) -> None:
+        with self.lock:
+            self.totals[name] = self.totals.get(name, 0.0) + seconds
+            self.counts[name] = self.counts.get(name, 0) + count
+
+    def merge(self, other: "StageTimer") -> None:
+        # Spans of a worker process hang below the span that is open while merging.
+        parent = current_span.get()
+        with self.lock:
+            offset = len(self.spans)
+            for record in other.spans:
+                self.spans.append(Span(record.id + offset,
+                                       record.parent + offset if record.parent is not None else parent,
+                                       record.name,
+                                       record.start,
+                                       record.duration,
+                                       record.attributes))
+        for name in other.totals:
+            self.add(name, other.totals[name], other.counts[name])
+
+    def span_tree(self) -> list[dict]:
+        origin = min((record.start for record in self.spans), default=0.0)
+        nodes = [{"name": record.name,
+                  **record.attributes,
+                  "start": record.start - origin,
+                  "duration": record.duration,
+                  "children": []} for record in self.spans]
+        roots = []
+        for record in self.spans:
+            if record.parent is None:
+                roots.append(nodes[record.id])
+            else:
+                nodes[record.parent]["children"].append(nodes[record.id])
+        return roots
+
+    def export(self, jsonPath: Path, csvPath: Path) -> None:
+        jsonPath.write_text(json.dumps(self.span_tree(), indent=1), encoding="utf-8")
+
+        origin = min((record.start for record in self.spans), default=0.0)
+        attribute_names = list(dict.fromkeys(name for record in self.spans for name in record.attributes))
+        with csvPath.open("w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["id", "parent", "name", *attribute_names, "start", "duration"])
+            for record in self.spans:
+                writer.writerow([record.id,
+                                 record.parent if record.parent is not None else "",
+                                 record.name,
+                                 *(record.attributes.get(name, "") for name in attribute_names),
+                                 f"{record.start - origin:.6f}",
+                                 f"{record.duration:.6f}"])
+
+    def __getstate__(self) -> dict:
+        return {"totals": self.totals, "counts": self.counts, "spans": self.spans}
+
+    def __setstate__(self, state: dict) -> None:
+        self.totals = state["totals"]
+        self.counts = state["counts"]
+        self.spans = state["spans"]
+        self.lock = threading.Lock()
+
+    def __str__(self) -> str:
+        return "\n".join(f"{name}: {self.totals[name]:.4f}s ({self.counts[name]}x)" for name in self.totals)